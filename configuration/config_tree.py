@@ -0,0 +1,404 @@
+import logging
+import re
+import sys
+from array import array
+
+from ciscoconfparse.ciscoconfparse import build_space_tolerant_regex
+
+from configuration.ingest import MappedConfig
+from configuration.keyword_index import KeywordIndex
+from rules.condition.regex_registry import registry
+
+logger = logging.getLogger(__name__)
+
+# banner motd ^C ... ^C, every line up to the closing delimiter is a child of the banner line
+_BANNER = re.compile(r"^banner\s+\S+\s+(\^C|\S)")
+
+
+def _search(pattern, text):
+    # same shortcut as IOSCfgLine.re_search, a pattern found as a substring matches without running the regex
+    if isinstance(pattern, str):
+        if pattern in text:
+            return True
+        pattern = registry.compile(pattern)
+    return pattern.search(text) is not None
+
+
+class LineViewMixin:
+    """
+    Methods of IOSCfgLine shared by the read only line views, ConfigLine and OverlayLine, written in terms of their
+    text, children and all_children
+    """
+    __slots__ = ()
+
+    @property
+    def is_parent(self):
+        return self.has_children
+
+    @property
+    def is_comment(self):
+        return self.text.lstrip().startswith('!')
+
+    def re_search(self, regex, default=''):
+        if _search(regex, self.text):
+            return self.text
+        return default
+
+    def re_search_children(self, regex, recurse=False):
+        """
+        :param regex: str or compiled regex
+        :param recurse: bool, search every descendant instead of the children
+        :return: list of the matching line views
+        """
+        lines = self.all_children if recurse else self.children
+        return [line for line in lines if _search(regex, line.text)]
+
+    def has_child_with(self, linespec, all_children=False):
+        return bool(self.re_search_children(linespec, recurse=all_children))
+
+    def __deepcopy__(self, memo):
+        # lines are read only views, templates deep copying the condition results share them
+        return self
+
+
+class ParseViewMixin:
+    """
+    Methods of CiscoConfParse shared by the read only parses, ConfigTree and ConfigOverlay, written in terms of
+    find_objects and of references to their lines: _ref returns the reference of a line view, _parent and
+    _children the references of its parent, the line itself for a top level line, and of its children, _text its
+    text and _key its position in the configuration.
+    """
+
+    def find_objects_w_child(self, parentspec, childspec, ignore_ws=False, recurse=False):
+        """
+        :param parentspec: str, regex of the parent lines
+        :param childspec: str, regex of the children
+        :return: list of the line views matching parentspec with a child matching childspec
+        """
+        if ignore_ws:
+            parentspec = build_space_tolerant_regex(parentspec)
+            childspec = build_space_tolerant_regex(childspec)
+        return [obj for obj in self.find_objects(parentspec) if obj.re_search_children(childspec, recurse=recurse)]
+
+    def find_blocks(self, linespec, exactmatch=False, ignore_ws=False):
+        """
+        Same as CiscoConfParse.find_blocks, the matching lines, their siblings and all of their parents
+
+        :param linespec: str, regex
+        :return: list of str in configuration order
+        """
+        found = set()
+        for obj in self.find_objects(linespec, exactmatch=exactmatch, ignore_ws=ignore_ws):
+            ref = self._ref(obj)
+            found.add(ref)
+            # as in CiscoConfParse, the siblings of a top level line are its own children
+            found.update(self._children(self._parent(ref)))
+        for ref in list(found):
+            while self._parent(ref) != ref:
+                ref = self._parent(ref)
+                found.add(ref)
+        return [self._text(ref) for ref in sorted(found, key=self._key)]
+
+
+class ConfigLine(LineViewMixin):
+    """
+    Read only view of one line of a ConfigTree, with the attributes and methods of IOSCfgLine the conditions and
+    templates use. Views hold only the tree and the line number, the text and the relations live in the tree.
+    """
+    __slots__ = ('_tree', 'linenum')
+
+    def __init__(self, tree, linenum):
+        self._tree = tree
+        self.linenum = linenum
+
+    @property
+    def text(self):
+        return self._tree._texts[self.linenum]
+
+    @property
+    def indent(self):
+        return self._tree._indents[self.linenum]
+
+    @property
+    def parent(self):
+        return self._tree._line(self._tree._parents[self.linenum])
+
+    @property
+    def children(self):
+        return [self._tree._line(i) for i in self._tree._child_indexes(self.linenum)]
+
+    @property
+    def all_children(self):
+        return [self._tree._line(i) for i in self._tree._descendant_indexes(self.linenum)]
+
+    @property
+    def all_parents(self):
+        parents = []
+        i = self.linenum
+        while self._tree._parents[i] != i:
+            i = self._tree._parents[i]
+            parents.append(self._tree._line(i))
+        parents.reverse()
+        return parents
+
+    @property
+    def has_children(self):
+        return self._tree._child_offsets[self.linenum + 1] > self._tree._child_offsets[self.linenum]
+
+    @property
+    def is_child(self):
+        return self._tree._parents[self.linenum] != self.linenum
+
+    def re_search_children(self, regex, recurse=False):
+        """
+        Same as LineViewMixin.re_search_children, searching the texts of the tree so views are only made for the
+        matching lines
+
+        :param regex: str or compiled regex
+        :param recurse: bool, search every descendant instead of the children
+        :return: list of the matching ConfigLine objects
+        """
+        tree = self._tree
+        if recurse:
+            indexes = tree._descendant_indexes(self.linenum)
+        else:
+            indexes = tree._child_indexes(self.linenum)
+        texts = tree._texts
+        return [tree._line(i) for i in indexes if _search(regex, texts[i])]
+
+    def __lt__(self, other):
+        return self.linenum < other.linenum
+
+    def __repr__(self):
+        if self.is_child:
+            return "<ConfigLine # {} '{}' (parent is # {})>".format(self.linenum, self.text,
+                                                                   self._tree._parents[self.linenum])
+        return "<ConfigLine # {} '{}'>".format(self.linenum, self.text)
+
+
+class ConfigTree(ParseViewMixin):
+    """
+    Compact, read only parse of a configuration for rule evaluation.
+
+    CiscoConfParse builds a mutable IOSCfgLine object per line, each with its own attribute dictionary and lists of
+    children. ConfigTree keeps the interned line texts in one list and the relations in parallel arrays: indent,
+    parent index and, in compressed form, the child indexes of every line. ConfigLine views are only created for
+    the lines a search returns, so scans over children walk contiguous arrays. Built from a MappedConfig, the texts
+    stay in the mapped buffer and each line is decoded when it is read.
+
+    Lines are related exactly the way CiscoConfParse relates them with the ios syntax, see _relate, so conditions
+    return the same lines with either parse.
+
+    ConfigTree implements the part of the CiscoConfParse API used by the conditions: find_objects,
+    find_objects_w_child, find_blocks and ConfigObjs, and the IOSCfgLine API used by the conditions and templates.
+    It cannot be modified, rules run with modify_config modify a ConfigOverlay of the tree.
+
+    Example:
+    tree = ConfigTree(running_config.splitlines())
+    tree.find_objects_w_child(r"^interface", r"vpc\s+\d+")
+    [<ConfigLine # 450 'interface port-channel1'>]
+    """
+
+    def __init__(self, config):
+        """
+        :param config: list of configuration lines, str or MappedConfig
+        """
+        if isinstance(config, str):
+            config = config.splitlines()
+        parents, indents, kept = self._relate(config)
+        # blank lines are dropped after relating the lines, as CiscoConfParse does
+        renumber = {old: new for new, old in enumerate(kept)}
+        if isinstance(config, MappedConfig):
+            # the lines stay in the mapped buffer and are decoded when they are read
+            texts = config if len(kept) == len(config) else config.select(kept)
+        else:
+            texts = [sys.intern(config[i]) for i in kept]
+        indents = array('H', (indents[i] for i in kept))
+        parents = array('l', (renumber.get(parents[i], new) for new, i in enumerate(kept)))
+        self._texts = texts
+        self._indents = indents
+        self._parents = parents
+        counts = [0] * (len(texts) + 1)
+        for i, parent in enumerate(parents):
+            if parent != i:
+                counts[parent + 1] += 1
+        offsets = array('l', [0])
+        for count in counts[1:]:
+            offsets.append(offsets[-1] + count)
+        child_indexes = array('l', [0] * len(texts))
+        fill = array('l', offsets)
+        for i, parent in enumerate(parents):
+            if parent != i:
+                child_indexes[fill[parent]] = i
+                fill[parent] += 1
+        self._child_offsets = offsets
+        self._child_index = child_indexes[:offsets[-1]]
+        self._lines = [None] * len(texts)
+        self._keywords = None
+        logger.debug("ConfigTree: {} lines".format(len(texts)))
+
+    @staticmethod
+    def _relate(config):
+        """
+        Finds the parent of every line the way CiscoConfParse.ConfigList.bootstrap_obj_init_ng does with the ios
+        syntax, including its parent cache and its handling of comments, so both parses agree on every
+        relationship.
+
+        Every line but the banners is read once, so a MappedConfig decodes each line a single time.
+
+        :param config: list of str or MappedConfig
+        :return: tuple, (list of the index of the parent of each line, a top level line is its own parent,
+        list of the indent of each line, list of the indexes of the lines that are not blank)
+        """
+        indents = []
+        comments = []
+        config_lines = []
+        kept = []
+        banners = []
+        for i, line in enumerate(config):
+            stripped = line.lstrip()
+            indents.append(len(line) - len(stripped))
+            comment = stripped.startswith('!')
+            comments.append(comment)
+            config_lines.append(bool(stripped) and not comment)
+            if stripped:
+                kept.append(i)
+            if line.startswith('banner'):
+                banners.append(i)
+        parents = list(range(len(config)))
+        cache = {}
+        max_indent = 0
+        for i, indent in enumerate(indents):
+            parent = None
+            if indent < max_indent and config_lines[i]:
+                for cached in [k for k in cache if k >= indent]:
+                    del cache[cached]
+            else:
+                parent = cache.get(indent)
+            if indent > 0:
+                if parent is None:
+                    for j in range(i - 1, -1, -1):
+                        if indents[j] < indent and config_lines[j]:
+                            parent = cache[indent] = j
+                            break
+                # a comment is not the child of a parent when the line above it is indented more
+                if parent is not None and not (comments[i] and indents[i - 1] > indent):
+                    parents[i] = parent
+            if indent == 0 and config_lines[i]:
+                max_indent = 0
+            elif indent > max_indent:
+                max_indent = indent
+        i = 0
+        for banner in banners:
+            if banner < i:
+                # inside the text of the previous banner
+                continue
+            line = config[banner]
+            match = _BANNER.match(line)
+            if not match or match.group(1) in line[match.end():]:
+                continue
+            delimiter = match.group(1)
+            i = banner + 1
+            while i < len(parents):
+                parents[i] = banner
+                i += 1
+                if delimiter in config[i - 1]:
+                    break
+        return parents, indents, kept
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_lines']
+        state['_keywords'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lines = [None] * len(self._texts)
+
+    @property
+    def keywords(self):
+        """
+        KeywordIndex of the lines, built on the first search
+        """
+        if self._keywords is None:
+            self._keywords = KeywordIndex(self._texts)
+        return self._keywords
+
+    def line(self, linenum):
+        """
+        :param linenum: int
+        :return: ConfigLine
+        """
+        return self._line(linenum)
+
+    def _line(self, i):
+        line = self._lines[i]
+        if line is None:
+            line = self._lines[i] = ConfigLine(self, i)
+        return line
+
+    def _child_indexes(self, i):
+        return self._child_index[self._child_offsets[i]:self._child_offsets[i + 1]]
+
+    def _descendant_indexes(self, i):
+        indexes = []
+        pending = list(reversed(self._child_indexes(i)))
+        while pending:
+            j = pending.pop()
+            indexes.append(j)
+            pending.extend(reversed(self._child_indexes(j)))
+        indexes.sort()
+        return indexes
+
+    @property
+    def ConfigObjs(self):
+        return [self._line(i) for i in range(len(self._texts))]
+
+    @property
+    def texts(self):
+        return self._texts
+
+    def find_objects(self, linespec, exactmatch=False, ignore_ws=False):
+        """
+        :param linespec: str, regex
+        :return: list of ConfigLine objects whose text matches linespec
+        """
+        if ignore_ws:
+            linespec = build_space_tolerant_regex(linespec)
+        if exactmatch:
+            linespec = "^{}$".format(linespec)
+        return [self._line(i) for i in self.keywords.search(linespec)]
+
+    def find_objects_many(self, patterns):
+        """
+        Same as [tree.find_objects(pattern) for pattern in patterns], with a single pass over the lines
+
+        :param patterns: list of regex strings
+        :return: list of lists of ConfigLine objects, one per pattern
+        """
+        from configuration.multi_pattern import get_matcher
+        found = get_matcher(patterns).match(self._texts)
+        return [[self._line(i) for i in found[pattern]] for pattern in patterns]
+
+    # line references of ParseViewMixin, the line numbers
+
+    @staticmethod
+    def _ref(obj):
+        return obj.linenum
+
+    def _parent(self, i):
+        return self._parents[i]
+
+    def _children(self, i):
+        return self._child_indexes(i)
+
+    def _text(self, i):
+        return self._texts[i]
+
+    @staticmethod
+    def _key(i):
+        return i
+
+    def __len__(self):
+        return len(self._texts)
@@ -0,0 +1,96 @@
+import logging
+from difflib import SequenceMatcher
+
+from rules.condition.regex_registry import registry
+
+logger = logging.getLogger(__name__)
+
+
+def top_level_blocks(parse):
+    """
+    Splits a parsed configuration into its top level blocks, each top level line with all of its descendants
+
+    :param parse: CiscoConfParse object
+    :return: list of tuples, (tuple of line texts, list of IOSCfgLine objects)
+    """
+    blocks = []
+    for obj in parse.ConfigObjs:
+        if obj.indent == 0 or not blocks:
+            blocks.append(([], []))
+        blocks[-1][0].append(obj.text)
+        blocks[-1][1].append(obj)
+    return [(tuple(texts), objs) for texts, objs in blocks]
+
+
+class ConfigDelta:
+    """
+    Block level difference between two parses of the configuration of a device.
+
+    The configurations are compared one top level block at a time. A block that is unchanged has the same lines in
+    both configurations, so the IOSCfgLine objects of the previous parse in unchanged blocks map one to one to the
+    objects of the new parse.
+
+    Example:
+    delta = ConfigDelta(old_parse, new_parse)
+    delta.changed_lines
+    ['interface Ethernet1/1', '  description uplink', 'interface Ethernet1/1', '  description core uplink']
+    delta.affects([r"^interface"])
+    True
+    delta.affects([r"^router\s+bgp"])
+    False
+    """
+
+    def __init__(self, old_parse, new_parse):
+        old_blocks = top_level_blocks(old_parse)
+        new_blocks = top_level_blocks(new_parse)
+        self.changed_lines = []
+        self._object_map = {}
+        matcher = SequenceMatcher(None, [texts for texts, objs in old_blocks], [texts for texts, objs in new_blocks],
+                                  autojunk=False)
+        for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+            if tag == 'equal':
+                for (_, old_objs), (_, new_objs) in zip(old_blocks[i1:i2], new_blocks[j1:j2]):
+                    for old_obj, new_obj in zip(old_objs, new_objs):
+                        self._object_map[id(old_obj)] = new_obj
+            else:
+                for texts, _ in old_blocks[i1:i2]:
+                    self.changed_lines.extend(texts)
+                for texts, _ in new_blocks[j1:j2]:
+                    self.changed_lines.extend(texts)
+        logger.debug("ConfigDelta: {} changed lines, {} unchanged lines".format(len(self.changed_lines),
+                                                                               len(self._object_map)))
+
+    @property
+    def unchanged(self):
+        return not self.changed_lines
+
+    def affects(self, patterns):
+        """
+        :param patterns: list of regex strings
+        :return: bool, True if any pattern matches a line of a changed block
+        """
+        for pattern in patterns:
+            compiled = registry.compile(pattern)
+            for text in self.changed_lines:
+                if compiled.search(text):
+                    return True
+        return False
+
+    def remap(self, results):
+        """
+        Replaces the IOSCfgLine objects of the previous parse in the results of a condition with the objects of the
+        new parse
+
+        :param results: results of AbsCondition.run
+        :return: results referencing the new parse
+        :raises KeyError: if an object is in a changed block
+        """
+        if isinstance(results, list):
+            return [self.remap(r) for r in results]
+        if isinstance(results, tuple):
+            return tuple(self.remap(r) for r in results)
+        if isinstance(results, dict):
+            return {self.remap(k): self.remap(v) for k, v in results.items()}
+        if hasattr(results, 'linenum') and hasattr(results, 'text'):
+            return self._object_map[id(results)]
+        return results
@@ -0,0 +1,182 @@
+import hashlib
+import logging
+import mmap
+import os
+from array import array
+
+logger = logging.getLogger(__name__)
+
+_CHUNK = 1 << 20
+
+
+class MappedConfig:
+    """
+    Configuration held as a memory mapped buffer with an index of its lines.
+
+    The configuration text is never held as one str and is not split into a list of line strings. The buffer is
+    mapped from a file, so its pages belong to the page cache instead of the memory of the worker, and the index
+    only holds the start and end offsets of each line. A line is decoded when it is read, so a ConfigTree built
+    from a MappedConfig only materializes the lines a condition returns.
+
+    MappedConfig is a sequence of str, the lines of the configuration without their line endings, and can be used
+    wherever the list returned by running_config.splitlines() is used. splitlines and text materialize the lines
+    or the whole text, for consumers such as CiscoConfParse that need them.
+
+    Example:
+    config = MappedConfig.from_file("/var/spool/rollout/n9k-1.cfg")
+    len(config)
+    214033
+    config[450]
+    'interface port-channel1'
+    tree = ConfigTree(config)
+    """
+
+    def __init__(self, buffer, starts=None, ends=None, path=None):
+        """
+        :param buffer: mmap, bytes or other buffer supporting find and slicing
+        :param starts: optional array of the offsets of the first byte of each line, built from the buffer if None
+        :param ends: optional array of the offsets following the last byte of each line
+        :param path: optional str, file the buffer is mapped from
+        """
+        self._buffer = buffer
+        self.path = path
+        # True when the lines cover the whole buffer, False for a selection of the lines of another MappedConfig
+        self._whole = starts is None
+        if starts is None:
+            starts, ends = self._index(buffer)
+        self._starts = starts
+        self._ends = ends
+        self._digest = None
+        logger.debug("MappedConfig: {} lines, {} bytes".format(len(starts), len(buffer)))
+
+    @staticmethod
+    def _index(buffer):
+        """
+        :return: tuple, (array of line starts, array of line ends), a trailing \\r is not part of the line
+        """
+        starts = array('Q')
+        ends = array('Q')
+        size = len(buffer)
+        start = 0
+        while start < size:
+            end = buffer.find(b'\n', start)
+            if end == -1:
+                end = size
+            starts.append(start)
+            ends.append(end - 1 if end > start and buffer[end - 1:end] == b'\r' else end)
+            start = end + 1
+        return starts, ends
+
+    @classmethod
+    def from_file(cls, path):
+        """
+        :param path: str, configuration file
+        :return: MappedConfig
+        """
+        with open(path, 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                # an empty file cannot be mapped
+                return cls(b'', path=path)
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return cls(buffer, path=path)
+
+    @classmethod
+    def spool(cls, config, directory, name):
+        """
+        Writes a configuration received from a device to a file and maps it, so the str can be released
+
+        :param config: str, configuration text
+        :param directory: str, spool directory, created if needed
+        :param name: str, file name, usually the device name
+        :return: MappedConfig
+        """
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, "{}.cfg".format(name))
+        tmp = "{}.{}.tmp".format(path, os.getpid())
+        with open(tmp, 'wb') as f:
+            f.write(config.encode('utf-8', 'surrogateescape'))
+        os.replace(tmp, path)
+        return cls.from_file(path)
+
+    def select(self, indexes):
+        """
+        :param indexes: iterable of line indexes
+        :return: MappedConfig of the selected lines, sharing the buffer
+        """
+        indexes = list(indexes)
+        return MappedConfig(self._buffer, array('Q', (self._starts[i] for i in indexes)),
+                            array('Q', (self._ends[i] for i in indexes)), path=self.path)
+
+    def digest(self):
+        """
+        :return: str, sha256 of the buffer, the same as the sha256 of the utf-8 text of a file with \\n line endings
+        """
+        if self._digest is None:
+            if self._whole:
+                sha = hashlib.sha256()
+                for offset in range(0, len(self._buffer), _CHUNK):
+                    sha.update(self._buffer[offset:offset + _CHUNK])
+            else:
+                sha = hashlib.sha256(b'\n'.join(self._bytes(i) for i in range(len(self._starts))))
+            self._digest = sha.hexdigest()
+        return self._digest
+
+    def _bytes(self, i):
+        return self._buffer[self._starts[i]:self._ends[i]]
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self._starts)))]
+        return self._buffer[self._starts[i]:self._ends[i]].decode('utf-8', 'surrogateescape')
+
+    def __iter__(self):
+        buffer = self._buffer
+        for start, end in zip(self._starts, self._ends):
+            yield buffer[start:end].decode('utf-8', 'surrogateescape')
+
+    def __len__(self):
+        return len(self._starts)
+
+    def splitlines(self):
+        """
+        :return: list of str, every line of the configuration
+        """
+        return list(self)
+
+    @property
+    def text(self):
+        """
+        :return: str, the whole configuration
+        """
+        return '\n'.join(self)
+
+    def __eq__(self, other):
+        if isinstance(other, MappedConfig):
+            return len(self) == len(other) and self.digest() == other.digest()
+        if isinstance(other, str):
+            return self.digest() == hashlib.sha256(other.encode('utf-8', 'surrogateescape')).hexdigest()
+        return NotImplemented
+
+    def __hash__(self):
+        return hash(self.digest())
+
+    def __getstate__(self):
+        # a mapped buffer cannot be pickled, the lines are pickled with their own buffer
+        if self._whole:
+            buffer = self._buffer[:]
+        else:
+            buffer = b'\n'.join(self._bytes(i) for i in range(len(self._starts)))
+        return {'buffer': buffer, 'path': self.path}
+
+    def __setstate__(self, state):
+        self.__init__(state['buffer'], path=state['path'])
+
+    def close(self):
+        """
+        Unmaps the buffer, the lines cannot be read afterwards
+        """
+        if isinstance(self._buffer, mmap.mmap):
+            self._buffer.close()
+
+    def __repr__(self):
+        return "<MappedConfig {} lines{}>".format(len(self), " from {}".format(self.path) if self.path else "")
@@ -0,0 +1,177 @@
+import logging
+import re
+from array import array
+from heapq import merge
+
+try:
+    from re import _parser as sre_parse
+except ImportError:
+    import sre_parse
+
+from rules.condition.regex_registry import registry
+
+logger = logging.getLogger(__name__)
+
+_prefixes = {}
+
+
+def _is_space(item):
+    """
+    True for \\s and a literal space, the ways rules separate the words of a command
+    """
+    op, av = item
+    if op == sre_parse.LITERAL:
+        return chr(av).isspace()
+    if op == sre_parse.IN:
+        return av == [(sre_parse.CATEGORY, sre_parse.CATEGORY_SPACE)]
+    return False
+
+
+def _is_space_repeat(item, minimum=0):
+    op, av = item
+    if op not in (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT) or av[0] < minimum:
+        return False
+    subpattern = list(av[2])
+    return len(subpattern) == 1 and _is_space(subpattern[0])
+
+
+def literal_prefix(pattern):
+    """
+    Extracts the literal text every line matching the regex must contain, as the first characters of the match.
+
+    A word separator following the literal, such as \\s+ or a space, is kept as a single trailing space, so the
+    literal tells whether its last word is complete.
+
+    Examples:
+    literal_prefix(r"^interface")
+    (True, 'interface')
+    literal_prefix(r"^router\\s+bgp")
+    (True, 'router ')
+    literal_prefix(r"^\\s*router ospf")
+    (True, 'router ospf')
+    literal_prefix(r"interface port-channel")
+    (False, 'interface port-channel')
+    literal_prefix(r"^(interface|router)")
+    (True, '')
+
+    :param pattern: str, regex
+    :return: tuple, (anchored, literal), anchored is True if the literal starts the first word of the line
+    """
+    try:
+        return _prefixes[pattern]
+    except KeyError:
+        pass
+    anchored, literal = False, ''
+    try:
+        parsed = sre_parse.parse(pattern)
+    except (re.error, TypeError):
+        parsed = None
+    if parsed is not None and not parsed.state.flags & (re.IGNORECASE | re.MULTILINE | re.VERBOSE):
+        items = list(parsed)
+        i = 0
+        if items and items[0] == (sre_parse.AT, sre_parse.AT_BEGINNING):
+            anchored = True
+            i = 1
+            # leading indentation, ^\s* or ^\s+
+            if i < len(items) and _is_space_repeat(items[i]):
+                i += 1
+        chars = []
+        while i < len(items) and items[i][0] == sre_parse.LITERAL:
+            chars.append(chr(items[i][1]))
+            i += 1
+        if chars and i < len(items) and (_is_space(items[i]) or _is_space_repeat(items[i], minimum=1)):
+            chars.append(' ')
+        literal = ''.join(chars)
+        if anchored and literal[:1].isspace():
+            # the pattern matches on the indentation, not on the first word
+            anchored = False
+    _prefixes[pattern] = (anchored, literal)
+    return anchored, literal
+
+
+def keyword(pattern):
+    """
+    The first word of every line the regex can match, if the regex is anchored on it
+
+    Examples:
+    keyword(r"^router\\s+bgp")
+    ('router', True)
+    keyword(r"^interface")
+    ('interface', False)
+    keyword(r"interface port-channel")
+    None
+
+    :param pattern: str, regex
+    :return: tuple, (word, True if the word is complete), or None if the regex is not anchored on a word
+    """
+    anchored, literal = literal_prefix(pattern)
+    if not anchored or not literal:
+        return None
+    words = literal.split(None, 1)
+    return words[0], len(words) > 1 or literal[-1].isspace()
+
+
+class KeywordIndex:
+    """
+    Inverted index of the lines of a configuration by their first word.
+
+    Almost every parent regex is anchored on a leading keyword, ^interface, ^router\\s+bgp, ^aaa group server. For
+    those, only the lines starting with the keyword are tested against the regex instead of every line of the
+    configuration. Unanchored regexes with a literal prefix, such as "interface port-channel", are tested only
+    against the lines containing the literal.
+
+    Example:
+    index = KeywordIndex([obj.text for obj in parse.ConfigObjs])
+    index.search(r"^interface\\s+port-channel")
+    [450, 475, 489]
+    """
+
+    def __init__(self, texts):
+        """
+        :param texts: list of configuration lines or MappedConfig
+        """
+        self._texts = texts
+        self._index = {}
+        for i, text in enumerate(texts):
+            words = text.split(None, 1)
+            if words:
+                self._index.setdefault(words[0], []).append(i)
+        # the line numbers of large configurations are held in arrays instead of lists of int objects
+        self._index = {word: array('l', indexes) for word, indexes in self._index.items()}
+        logger.debug("KeywordIndex: {} lines, {} keywords".format(len(texts), len(self._index)))
+
+    def candidates(self, word, complete):
+        """
+        :param word: str, first word
+        :param complete: bool, if False, lines whose first word starts with word are candidates
+        :return: sorted list of line indexes
+        """
+        if complete:
+            return self._index.get(word, [])
+        lists = [indexes for first, indexes in self._index.items() if first.startswith(word)]
+        if len(lists) == 1:
+            return list(lists[0])
+        return list(merge(*lists))
+
+    def search(self, pattern):
+        """
+        :param pattern: str, regex
+        :return: list of the indexes of the lines matching the regex, in configuration order
+        """
+        compiled = registry.compile(pattern)
+        texts = self._texts
+        key = keyword(pattern)
+        if key is not None:
+            return [i for i in self.candidates(*key) if compiled.search(texts[i])]
+        anchored, literal = literal_prefix(pattern)
+        literal = literal.rstrip()
+        if literal:
+            return [i for i, text in enumerate(texts) if literal in text and compiled.search(text)]
+        return [i for i, text in enumerate(texts) if compiled.search(text)]
+
+    @property
+    def texts(self):
+        return self._texts
+
+    def __len__(self):
+        return len(self._index)
@@ -0,0 +1,164 @@
+import logging
+
+from configuration.config_tree import ConfigTree
+from configuration.overlay import ConfigOverlay
+
+logger = logging.getLogger(__name__)
+
+
+class ConfigMerge:
+    """
+    Merges generated configuration templates into a parsed configuration.
+
+    Lines are matched on their text, not with regexes. The top level lines of the configuration and the children of
+    each parent are indexed in dictionaries keyed by the text, so finding whether a template line is already
+    configured is one lookup instead of a scan of the configuration. Missing lines are collected as insertions and
+    written with a single commit, instead of a commit and a full parse after nearly every line. Merging into a
+    ConfigOverlay adds the lines to a new overlay, the base parse is not modified.
+
+    A template line missing from the configuration is added with all of its children: a top level line at the end
+    of the configuration, a child after the last line of its parent's family. A template parent found in the
+    configuration is merged recursively, only the children it lacks are added.
+
+    Example:
+    merge = ConfigMerge(parse)
+    merge.merge("interface Ethernet1/1\\n  description uplink\\n  no shutdown")
+    merge.merge("feature lacp")
+    parse = merge.commit()
+    """
+
+    def __init__(self, parse):
+        """
+        :param parse: CiscoConfParse object, ScannedConfig wrapping one or ConfigOverlay
+        """
+        self.parse = parse
+        self._top = None
+        self._children = {}
+        # planned additions, (configuration line or None for a top level line, template line)
+        self._additions = []
+        # the template lines already planned, so templates of several rules do not add the same line twice
+        self._planned_top = set()
+        self._planned_children = {}
+
+    def _find_top(self, key):
+        if isinstance(self.parse, ConfigOverlay):
+            return self.parse.top_level_line(key)
+        if self._top is None:
+            self._top = {}
+            for obj in self.parse.ConfigObjs:
+                if not obj.is_child:
+                    self._top.setdefault(obj.text.rstrip(), obj)
+        return self._top.get(key)
+
+    def _child_map(self, obj):
+        children = self._children.get(id(obj))
+        if children is None:
+            children = self._children[id(obj)] = {}
+            for child in obj.children:
+                children.setdefault(child.text.strip(), child)
+        return children
+
+    @staticmethod
+    def _depth(obj):
+        depth = 0
+        while obj.is_child:
+            obj = obj.parent
+            depth += 1
+        return depth
+
+    @staticmethod
+    def _family(line):
+        return [line.text] + [child.text for child in line.all_children]
+
+    def merge(self, template):
+        """
+        Plans the insertion of the lines of the template missing from the configuration
+
+        :param template: str, configuration generated by a rule
+        :return: int, number of lines planned for insertion
+        """
+        logger.debug("ConfigMerge: merge: template: {}".format(template))
+        tree = ConfigTree(template)
+        count = 0
+        for line in tree.ConfigObjs:
+            if line.is_child:
+                continue
+            key = line.text.rstrip()
+            obj = self._find_top(key)
+            if obj is not None:
+                count += self._merge_children(obj, line)
+            elif key not in self._planned_top:
+                logger.debug("ConfigMerge: merge: appending {}".format(line.text))
+                self._planned_top.add(key)
+                self._additions.append((None, line))
+                count += 1 + len(line.all_children)
+        return count
+
+    def _merge_children(self, obj, line):
+        """
+        :param obj: configuration line matching the template line
+        :param line: ConfigLine of the template
+        :return: int, number of lines planned for insertion
+        """
+        count = 0
+        children = self._child_map(obj)
+        planned = self._planned_children.setdefault(id(obj), set())
+        for child in line.children:
+            key = child.text.strip()
+            found = children.get(key)
+            if found is not None:
+                count += self._merge_children(found, child)
+            elif key not in planned:
+                logger.debug("ConfigMerge: merge: adding {} to {}".format(child.text, obj.text))
+                planned.add(key)
+                self._additions.append((obj, child))
+                count += 1 + len(child.all_children)
+        return count
+
+    def commit(self):
+        """
+        Writes the planned insertions to the configuration and commits it once.
+
+        A ConfigOverlay is not modified, the lines are added to a new overlay derived from it.
+
+        :return: the parse, or the new ConfigOverlay
+        """
+        additions = [(obj, self._family(line)) for obj, line in self._additions]
+        self._additions = []
+        self._planned_top = set()
+        self._planned_children = {}
+        if isinstance(self.parse, ConfigOverlay):
+            if additions:
+                self.parse = self.parse.add_many(additions)
+                self._children = {}
+            return self.parse
+        objects = list(self.parse.ConfigObjs)
+        positions = {id(obj): i for i, obj in enumerate(objects)}
+        insertions = {}
+        appended = []
+        for obj, family in additions:
+            if obj is None:
+                appended.extend(family)
+            else:
+                descendants = obj.all_children
+                position = positions[id(descendants[-1] if descendants else obj)]
+                insertions.setdefault(position, []).append((self._depth(obj), family))
+        config_objs = self.parse.ConfigObjs
+        # inserting from the end keeps the positions of the lines before each insertion valid
+        for position in sorted(insertions, reverse=True):
+            # a parent nested in another ends at the same line, the children of the inner parent go first so they
+            # are not written under a line added to the outer parent
+            families = sorted(insertions[position], key=lambda addition: -addition[0])
+            texts = [text for _, family in families for text in family]
+            insertions[position] = texts
+            for offset, text in enumerate(texts):
+                config_objs.insert(position + 1 + offset, text)
+        end = len(config_objs)
+        for offset, text in enumerate(appended):
+            config_objs.insert(end + offset, text)
+        logger.debug("ConfigMerge: commit: {} lines inserted, {} lines appended".format(
+            sum(len(texts) for texts in insertions.values()), len(appended)))
+        self.parse.commit()
+        self._top = None
+        self._children = {}
+        return self.parse
@@ -0,0 +1,145 @@
+import logging
+import re
+
+from configuration.keyword_index import keyword, literal_prefix
+from rules.condition.regex_registry import registry
+
+logger = logging.getLogger(__name__)
+
+# patterns that cannot be embedded in a combined alternation without changing their meaning
+_UNSAFE_PATTERN = re.compile(r"\\\d|\(\?P=|\(\?[aiLmsux]+\)")
+
+_matchers = {}
+
+
+class MultiPatternMatcher:
+    """
+    Finds the lines matching each of many regexes in a single sweep over the configuration.
+
+    Each regex is dispatched on the cheapest test that every line it matches must pass:
+    - regexes anchored on a keyword, ^ntp\\s+server, ^logging server, ^feature vpc, are only tested against lines
+      whose first word is the keyword, found with one dictionary lookup per line
+    - regexes starting with a literal, "interface port-channel", are only tested against lines containing the
+      literal. One alternation of all the literals is tested first, so most lines are rejected with one search
+    - the remaining regexes are joined in one alternation tested first, and tested one by one only on the lines
+      matching it
+
+    Example:
+    matcher = MultiPatternMatcher([r"^logging\\s+server", r"^ntp\\s+server", r"^feature\\s+vpc"])
+    matcher.match([obj.text for obj in parse.ConfigObjs])
+    {'^logging\\\\s+server': [12, 13], '^ntp\\\\s+server': [20], '^feature\\\\s+vpc': [38]}
+    """
+
+    def __init__(self, patterns):
+        self.patterns = []
+        for pattern in patterns:
+            if pattern not in self.patterns:
+                self.patterns.append(pattern)
+        self._keywords = {}
+        self._prefixes = {}
+        self._literals = []
+        others = []
+        for pattern in self.patterns:
+            compiled = registry.compile(pattern)
+            key = keyword(pattern)
+            if key is not None:
+                word, complete = key
+                table = self._keywords if complete else self._prefixes
+                table.setdefault(word, []).append((pattern, compiled))
+                continue
+            literal = literal_prefix(pattern)[1].strip()
+            if literal:
+                self._literals.append((literal, pattern, compiled))
+            else:
+                others.append((pattern, compiled))
+        self._prefixes = list(self._prefixes.items())
+        self._literal_filter = None
+        if self._literals:
+            literals = sorted(set(literal for literal, _, _ in self._literals), key=len, reverse=True)
+            self._literal_filter = re.compile("|".join(re.escape(literal) for literal in literals))
+        self._filtered = [(p, c) for p, c in others if not _UNSAFE_PATTERN.search(p)]
+        self._unfiltered = [(p, c) for p, c in others if _UNSAFE_PATTERN.search(p)]
+        self._prefilter = None
+        if self._filtered:
+            try:
+                self._prefilter = re.compile("|".join("(?:{})".format(p) for p, c in self._filtered))
+            except re.error as err:
+                logger.warning("MultiPatternMatcher: cannot combine patterns, testing each one: {}".format(err))
+                self._unfiltered = others
+                self._filtered = []
+        logger.debug("MultiPatternMatcher: {} patterns, {} by keyword, {} by literal, {} combined".format(
+            len(self.patterns), sum(len(v) for v in self._keywords.values()) + sum(len(v) for _, v in self._prefixes),
+            len(self._literals), len(self._filtered)))
+
+    def match(self, texts):
+        """
+        :param texts: list of configuration lines
+        :return: dict, pattern: list of the indexes of the matching lines, in configuration order
+        """
+        found = {pattern: [] for pattern in self.patterns}
+        keywords = self._keywords
+        prefixes = self._prefixes
+        by_word = bool(keywords or prefixes)
+        literals = self._literals
+        literal_filter = self._literal_filter
+        prefilter = self._prefilter
+        filtered = self._filtered
+        unfiltered = self._unfiltered
+        for i, text in enumerate(texts):
+            if by_word:
+                words = text.split(None, 1)
+                if words:
+                    word = words[0]
+                    for pattern, compiled in keywords.get(word, ()):
+                        if compiled.search(text):
+                            found[pattern].append(i)
+                    for prefix, entries in prefixes:
+                        if word.startswith(prefix):
+                            for pattern, compiled in entries:
+                                if compiled.search(text):
+                                    found[pattern].append(i)
+            if literal_filter is not None and literal_filter.search(text):
+                for literal, pattern, compiled in literals:
+                    if literal in text and compiled.search(text):
+                        found[pattern].append(i)
+            if prefilter is not None and prefilter.search(text):
+                for pattern, compiled in filtered:
+                    if compiled.search(text):
+                        found[pattern].append(i)
+            for pattern, compiled in unfiltered:
+                if compiled.search(text):
+                    found[pattern].append(i)
+        return found
+
+    def __len__(self):
+        return len(self.patterns)
+
+
+def get_matcher(patterns):
+    """
+    :param patterns: list of regex strings
+    :return: MultiPatternMatcher, shared by every caller passing the same patterns
+    """
+    key = tuple(patterns)
+    matcher = _matchers.get(key)
+    if matcher is None:
+        matcher = _matchers[key] = MultiPatternMatcher(patterns)
+    return matcher
+
+
+def find_objects_many(parse, patterns):
+    """
+    Same as [parse.find_objects(pattern) for pattern in patterns], with a single pass over the configuration
+
+    :param parse: CiscoConfParse, ConfigTree or ScannedConfig object
+    :param patterns: list of regex strings
+    :return: list of lists of line objects, one per pattern
+    """
+    if len(patterns) == 1:
+        return [parse.find_objects(patterns[0])]
+    many = getattr(parse, 'find_objects_many', None)
+    if many is not None:
+        return many(patterns)
+    objects = list(parse.ConfigObjs)
+    found = get_matcher(patterns).match([obj.text for obj in objects])
+    return [[objects[i] for i in found[pattern]] for pattern in patterns]
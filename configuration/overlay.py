@@ -0,0 +1,458 @@
+import logging
+from bisect import bisect_left
+
+from ciscoconfparse.ciscoconfparse import build_space_tolerant_regex
+
+from configuration.config_tree import ConfigTree, LineViewMixin, ParseViewMixin
+from configuration.multi_pattern import find_objects_many
+from rules.condition.regex_registry import registry
+
+logger = logging.getLogger(__name__)
+
+
+class _Node:
+    """
+    Line added by an overlay. Nodes are never modified, so overlays derived from each other share them.
+    """
+    __slots__ = ('text', 'parent', 'anchor')
+
+    def __init__(self, text, parent, anchor):
+        """
+        :param text: str
+        :param parent: base line number, _Node or None for a top level line
+        :param anchor: base line number the node follows, -1 before the first base line
+        """
+        self.text = text
+        self.parent = parent
+        self.anchor = anchor
+
+
+class _Base:
+    """
+    Read only state of the base parse shared by every overlay derived from it
+    """
+
+    def __init__(self, parse):
+        self.parse = parse
+        inner = getattr(parse, 'parse', parse)
+        if isinstance(inner, ConfigTree):
+            self.line = inner.line
+            self.size = len(inner)
+        else:
+            objects = list(inner.ConfigObjs)
+            self.line = objects.__getitem__
+            self.size = len(objects)
+        self._top = None
+
+    @property
+    def top(self):
+        """
+        dict, text of each top level line: line number of its first occurrence
+        """
+        if self._top is None:
+            self._top = {}
+            for i in range(self.size):
+                obj = self.line(i)
+                if not obj.is_child:
+                    self._top.setdefault(obj.text.rstrip(), i)
+        return self._top
+
+
+class OverlayLine(LineViewMixin):
+    """
+    Line of a ConfigOverlay, a line of the base parse or a line added by the overlay, with the attributes and
+    methods of IOSCfgLine the conditions and templates use. The relations are those of the overlay, a base parent
+    lists the children added under it. Other attributes of a base line are read from the base object.
+    """
+    __slots__ = ('_overlay', '_ref')
+
+    def __init__(self, overlay, ref):
+        self._overlay = overlay
+        self._ref = ref
+
+    @property
+    def text(self):
+        if isinstance(self._ref, _Node):
+            return self._ref.text
+        return self._overlay._base.line(self._ref).text
+
+    @property
+    def indent(self):
+        text = self.text
+        return len(text) - len(text.lstrip())
+
+    @property
+    def linenum(self):
+        return self._overlay._linenum(self._ref)
+
+    @property
+    def parent(self):
+        return self._overlay._view(self._overlay._parent(self._ref))
+
+    @property
+    def children(self):
+        return [self._overlay._view(ref) for ref in self._overlay._children(self._ref)]
+
+    @property
+    def all_children(self):
+        return [self._overlay._view(ref) for ref in self._overlay._descendants(self._ref)]
+
+    @property
+    def all_parents(self):
+        parents = []
+        ref = self._ref
+        while self._overlay._parent(ref) is not ref:
+            ref = self._overlay._parent(ref)
+            parents.append(self._overlay._view(ref))
+        parents.reverse()
+        return parents
+
+    @property
+    def has_children(self):
+        return bool(self._overlay._children(self._ref))
+
+    @property
+    def is_child(self):
+        return self._overlay._parent(self._ref) is not self._ref
+
+    def __lt__(self, other):
+        return self._overlay._key(self._ref) < other._overlay._key(other._ref)
+
+    def __getattr__(self, name):
+        if name.startswith('_') or isinstance(self._ref, _Node):
+            raise AttributeError("'{}' object has no attribute '{}'".format(self.__class__.__name__, name))
+        return getattr(self._overlay._base.line(self._ref), name)
+
+    def __repr__(self):
+        if self.is_child:
+            return "<OverlayLine # {} '{}' (parent is # {})>".format(self.linenum, self.text, self.parent.linenum)
+        return "<OverlayLine # {} '{}'>".format(self.linenum, self.text)
+
+
+class ConfigOverlay(ParseViewMixin):
+    """
+    Layered view of a configuration modified by rules run with modify_config: an immutable base parse and a small
+    delta of added and removed lines.
+
+    Searches run against the base with its own indexes, the KeywordIndex of a ConfigTree or the buckets of a
+    ScannedConfig, which stay valid since the base is never modified. Only the delta is searched line by line.
+    Modifying an overlay returns a new overlay sharing the base and the lines of the delta (copy on write), so
+    condition results computed against the previous overlay can be carried forward, see delta.
+
+    ConfigOverlay implements the part of the CiscoConfParse API used by the conditions: find_objects,
+    find_objects_many, find_objects_w_child, find_blocks, ConfigObjs and commit, and returns OverlayLine objects.
+
+    Example:
+    overlay = ConfigOverlay(parse_cache.get(running_config, parser=ConfigTree))
+    interface = overlay.find_objects(r"^interface Ethernet1/1$")[0]
+    overlay = overlay.add(interface, ["  mtu 9216"])
+    overlay.find_objects(r"mtu")
+    [<OverlayLine # 452 '  mtu 9216' (parent is # 450)>]
+    """
+
+    def __init__(self, base):
+        """
+        :param base: CiscoConfParse, ConfigTree or ScannedConfig object, it is never modified
+        """
+        self._base = base if isinstance(base, _Base) else _Base(base)
+        # base line number: the nodes following it, in configuration order
+        self._after = {}
+        # base line number, _Node or None: the nodes added as its children
+        self._added = {}
+        self._removed = set()
+        self._changes = []
+        self._origin = None
+        self._views = {}
+        self._offsets = None
+
+    @property
+    def base(self):
+        return self._base.parse
+
+    def copy(self):
+        """
+        :return: ConfigOverlay with the same lines, modifying it does not modify this overlay
+        """
+        overlay = ConfigOverlay(self._base)
+        overlay._after = dict(self._after)
+        overlay._added = dict(self._added)
+        overlay._removed = set(self._removed)
+        overlay._origin = self
+        return overlay
+
+    # relations
+
+    def _view(self, ref):
+        view = self._views.get(ref)
+        if view is None:
+            view = self._views[ref] = OverlayLine(self, ref)
+        return view
+
+    @staticmethod
+    def _ref(obj):
+        return obj._ref
+
+    def _text(self, ref):
+        return self._view(ref).text
+
+    def _key(self, ref):
+        if isinstance(ref, _Node):
+            return ref.anchor, 1, self._after[ref.anchor].index(ref)
+        return ref, 0, 0
+
+    def _parent(self, ref):
+        if isinstance(ref, _Node):
+            return ref if ref.parent is None else ref.parent
+        obj = self._base.line(ref)
+        if not obj.is_child:
+            return ref
+        return obj.parent.linenum
+
+    def _children(self, ref):
+        if isinstance(ref, _Node):
+            children = []
+        else:
+            children = [obj.linenum for obj in self._base.line(ref).children if obj.linenum not in self._removed]
+        added = self._added.get(ref)
+        if added:
+            children.extend(added)
+            children.sort(key=self._key)
+        return children
+
+    def _descendants(self, ref):
+        refs = []
+        pending = list(reversed(self._children(ref)))
+        while pending:
+            child = pending.pop()
+            refs.append(child)
+            pending.extend(reversed(self._children(child)))
+        return refs
+
+    def _linenum(self, ref):
+        if self._offsets is None:
+            anchors = sorted(anchor for anchor, nodes in self._after.items() if nodes)
+            counts = []
+            total = 0
+            for anchor in anchors:
+                total += len(self._after[anchor])
+                counts.append(total)
+            self._offsets = (anchors, counts, sorted(self._removed))
+        anchors, counts, removed = self._offsets
+        if isinstance(ref, _Node):
+            position = bisect_left(anchors, ref.anchor)
+            before = counts[position - 1] if position else 0
+            return ref.anchor + 1 - bisect_left(removed, ref.anchor + 1) + before + self._after[ref.anchor].index(ref)
+        position = bisect_left(anchors, ref)
+        return ref - bisect_left(removed, ref) + (counts[position - 1] if position else 0)
+
+    def _nodes(self):
+        for anchor in sorted(self._after):
+            for node in self._after[anchor]:
+                yield node
+
+    def _lines(self, base_objects, regex):
+        """
+        Merges the lines found in the base with the nodes matching the regex, in configuration order
+        """
+        refs = [obj.linenum for obj in base_objects if obj.linenum not in self._removed]
+        if self._after:
+            compiled = registry.compile(regex)
+            refs.extend(node for node in self._nodes() if compiled.search(node.text))
+            refs.sort(key=self._key)
+        return [self._view(ref) for ref in refs]
+
+    # CiscoConfParse API
+
+    @property
+    def ConfigObjs(self):
+        refs = list(self._after.get(-1, []))
+        for i in range(self._base.size):
+            if i not in self._removed:
+                refs.append(i)
+            refs.extend(self._after.get(i, []))
+        return [self._view(ref) for ref in refs]
+
+    @property
+    def ioscfg(self):
+        return [line.text for line in self.ConfigObjs]
+
+    def find_objects(self, linespec, exactmatch=False, ignore_ws=False):
+        """
+        :param linespec: str, regex
+        :return: list of OverlayLine objects whose text matches linespec
+        """
+        base = self._base.parse.find_objects(linespec, exactmatch=exactmatch, ignore_ws=ignore_ws)
+        if ignore_ws:
+            linespec = build_space_tolerant_regex(linespec)
+        if exactmatch:
+            linespec = "^{}$".format(linespec)
+        return self._lines(base, linespec)
+
+    def find_objects_many(self, patterns):
+        """
+        :param patterns: list of regex strings
+        :return: list of lists of OverlayLine objects, one per pattern
+        """
+        found = find_objects_many(self._base.parse, patterns)
+        return [self._lines(base, pattern) for base, pattern in zip(found, patterns)]
+
+    def commit(self):
+        """
+        Nothing to do, the overlay is current after every modification
+        """
+        return None
+
+    def __len__(self):
+        return self._base.size - len(self._removed) + sum(len(nodes) for nodes in self._after.values())
+
+    # modifications, each returns a new overlay
+
+    def top_level_line(self, text):
+        """
+        :param text: str, text of a top level line without trailing whitespace
+        :return: OverlayLine of its first occurrence or None
+        """
+        i = self._base.top.get(text)
+        if i is not None and i not in self._removed:
+            return self._view(i)
+        for node in self._added.get(None, []):
+            if node.text.rstrip() == text:
+                return self._view(node)
+        return None
+
+    def add(self, parent, lines):
+        """
+        Adds lines after the last line of the family of parent
+
+        :param parent: OverlayLine or None to add top level lines at the end of the configuration
+        :param lines: list of str, the first line and the lines indented less than or as much as it are children
+        of parent, the lines indented more are their children
+        :return: ConfigOverlay
+        """
+        return self.add_many([(parent, lines)])
+
+    def add_many(self, additions):
+        """
+        :param additions: list of tuples, (parent, lines), see add
+        :return: ConfigOverlay
+        """
+        overlay = self.copy()
+        for parent, lines in additions:
+            overlay._add(None if parent is None else parent._ref, lines)
+        logger.debug("ConfigOverlay: {} families added".format(len(additions)))
+        return overlay
+
+    def _add(self, parent, lines):
+        if parent is None:
+            anchor = self._base.size - 1
+            position = len(self._after.get(anchor, []))
+        else:
+            last = max([parent] + self._descendants(parent), key=self._key)
+            if isinstance(last, _Node):
+                anchor = last.anchor
+                position = self._after[anchor].index(last) + 1
+            else:
+                anchor = last
+                position = 0
+        tree = ConfigTree(lines)
+        nodes = {}
+        for line in tree.ConfigObjs:
+            node_parent = nodes[line.parent.linenum] if line.is_child else parent
+            node = nodes[line.linenum] = _Node(line.text, node_parent, anchor)
+            self._added[node_parent] = self._added.get(node_parent, []) + [node]
+            self._changes.append((False, node))
+        after = list(self._after.get(anchor, []))
+        after[position:position] = [nodes[i] for i in range(len(tree))]
+        self._after[anchor] = after
+        self._views = {}
+        self._offsets = None
+
+    def remove(self, line):
+        """
+        Removes a line and its family
+
+        :param line: OverlayLine
+        :return: ConfigOverlay
+        """
+        overlay = self.copy()
+        for ref in [line._ref] + self._descendants(line._ref):
+            overlay._changes.append((True, ref))
+            if isinstance(ref, _Node):
+                overlay._after[ref.anchor] = [node for node in overlay._after[ref.anchor] if node is not ref]
+                overlay._added[ref.parent] = [node for node in overlay._added[ref.parent] if node is not ref]
+            else:
+                overlay._removed.add(ref)
+        return overlay
+
+    def delta(self, old):
+        """
+        :param old: ConfigOverlay this overlay was derived from
+        :return: OverlayDelta, for ConditionCache.carry_forward
+        """
+        return OverlayDelta(old, self)
+
+    def __repr__(self):
+        return "<ConfigOverlay {} lines, {} added, {} removed>".format(len(self), len(list(self._nodes())),
+                                                                     len(self._removed))
+
+
+class OverlayDelta:
+    """
+    Difference between an overlay and the overlay it was derived from, with the interface of ConfigDelta.
+
+    As with ConfigDelta, every line of a top level block with an added or removed line is a changed line, since a
+    condition on the parent of the block can change when one of its descendants changes.
+    """
+
+    def __init__(self, old, new):
+        self._new = new
+        self.changed_lines = []
+        if new._origin is not old:
+            # not derived from old, every line is considered changed
+            self.changed_lines = [line.text for line in old.ConfigObjs] + [line.text for line in new.ConfigObjs]
+            return
+        tops = set()
+        for removed, ref in new._changes:
+            # a removed line is related through the overlay it was removed from
+            overlay = old if removed else new
+            while overlay._parent(ref) is not ref:
+                ref = overlay._parent(ref)
+            tops.add((overlay, ref))
+        for overlay, ref in tops:
+            self.changed_lines.extend(overlay._view(r).text for r in [ref] + overlay._descendants(ref))
+
+    @property
+    def unchanged(self):
+        return not self.changed_lines
+
+    def affects(self, patterns):
+        """
+        :param patterns: list of regex strings
+        :return: bool, True if any pattern matches a line of a changed block
+        """
+        for pattern in patterns:
+            compiled = registry.compile(pattern)
+            for text in self.changed_lines:
+                if compiled.search(text):
+                    return True
+        return False
+
+    def remap(self, results):
+        """
+        Replaces the OverlayLine objects of the previous overlay in the results of a condition with the lines of the
+        new overlay
+
+        :raises KeyError: if a line was removed
+        """
+        if isinstance(results, list):
+            return [self.remap(r) for r in results]
+        if isinstance(results, tuple):
+            return tuple(self.remap(r) for r in results)
+        if isinstance(results, dict):
+            return {self.remap(k): self.remap(v) for k, v in results.items()}
+        if isinstance(results, OverlayLine):
+            ref = results._ref
+            if ref in self._new._removed or isinstance(ref, _Node) and ref not in self._new._after.get(ref.anchor, []):
+                raise KeyError(ref)
+            return self._new._view(ref)
+        return results
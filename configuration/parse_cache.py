@@ -0,0 +1,164 @@
+import hashlib
+import logging
+import os
+import pickle
+from collections import OrderedDict
+from importlib.metadata import version, PackageNotFoundError
+
+from ciscoconfparse import CiscoConfParse
+
+from configuration.config_tree import ConfigTree
+from configuration.ingest import MappedConfig
+
+logger = logging.getLogger(__name__)
+
+try:
+    CISCOCONFPARSE_VERSION = version('ciscoconfparse')
+except PackageNotFoundError:
+    CISCOCONFPARSE_VERSION = 'unknown'
+
+DEFAULT_MAX_LINES = 2000000
+
+
+class ParseCache:
+    """
+    Content addressed cache of parsed configurations. Parses are keyed by the sha256 of the configuration text, so
+    tasks parsing the same snapshot of a device, or devices with identical configurations, share one parse.
+
+    The in memory layer is an LRU bounded by the total number of configuration lines held. The optional disk layer
+    keeps pickled parses in a directory. Loading a pickled parse is several times faster than parsing the text
+    again, and the disk layer survives the process, so later runs over the same snapshot skip parsing entirely.
+
+    Cached parses are shared and must not be modified, callers that modify the configuration, such as rules run
+    with modify_config, modify a ConfigOverlay of the parse.
+
+    Example:
+    cache = ParseCache(max_lines=500000, directory="/var/cache/rollout")
+    parse = cache.get(running_config)
+    cache.report()
+    {'entries': 12, 'lines': 402113, 'hits': 24, 'disk_hits': 3, 'misses': 12}
+    """
+
+    def __init__(self, max_lines=DEFAULT_MAX_LINES, directory=None):
+        """
+        :param max_lines: int, maximum number of configuration lines held in memory
+        :param directory: optional str, directory of the disk layer, created if needed
+        """
+        self.max_lines = max_lines
+        self.directory = directory
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+        self._entries = OrderedDict()
+        self._lines = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(config):
+        """
+        :param config: str, configuration text, or MappedConfig
+        :return: str, sha256 of the configuration text
+        """
+        if isinstance(config, MappedConfig):
+            return config.digest()
+        return hashlib.sha256(config.encode('utf-8', 'surrogateescape')).hexdigest()
+
+    def get(self, config, parser=CiscoConfParse):
+        """
+        Returns the parse of the configuration, parsing it only if it is in neither layer
+
+        :param config: str, configuration text, or MappedConfig
+        :param parser: class called with the list of configuration lines, CiscoConfParse or ConfigTree
+        :return: parser object
+        """
+        key = "{}-{}".format(parser.__name__, self.key(config))
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            logger.debug("ParseCache: hit for {}".format(key))
+            return entry[0]
+        parse = self._load(key)
+        if parse is not None:
+            self.disk_hits += 1
+        else:
+            self.misses += 1
+            # ConfigTree reads a MappedConfig without splitting it into a list of lines
+            parse = parser(config) if parser is ConfigTree else parser(config.splitlines())
+            self._store(key, parse)
+        self._add(key, parse)
+        return parse
+
+    def _add(self, key, parse):
+        if isinstance(parse, ConfigTree):
+            size = len(parse)
+        else:
+            size = len(parse.ConfigObjs)
+        if size > self.max_lines:
+            logger.debug("ParseCache: {} lines is larger than the cache, not kept in memory".format(size))
+            return
+        self._entries[key] = (parse, size)
+        self._lines += size
+        while self._lines > self.max_lines:
+            evicted, (_, evicted_size) = self._entries.popitem(last=False)
+            self._lines -= evicted_size
+            logger.debug("ParseCache: evicted {}".format(evicted))
+
+    def _path(self, key):
+        # pickles are only valid for the version of ciscoconfparse that wrote them
+        return os.path.join(self.directory, "{}-{}.pickle".format(key, CISCOCONFPARSE_VERSION))
+
+    def _load(self, key):
+        if self.directory is None:
+            return None
+        path = self._path(key)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, 'rb') as f:
+                return pickle.load(f)
+        except Exception as e:
+            logger.warning("ParseCache: cannot load {}, parsing again: {}".format(path, e))
+            return None
+
+    def _store(self, key, parse):
+        if self.directory is None:
+            return
+        path = self._path(key)
+        tmp = "{}.{}.tmp".format(path, os.getpid())
+        try:
+            with open(tmp, 'wb') as f:
+                pickle.dump(parse, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, path)
+        except Exception as e:
+            logger.warning("ParseCache: cannot write {}: {}".format(path, e))
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+    def report(self):
+        """
+        :return: dict
+        """
+        return {'entries': len(self._entries), 'lines': self._lines, 'hits': self.hits, 'disk_hits': self.disk_hits,
+                'misses': self.misses}
+
+    def clear(self):
+        """
+        Empties the in memory layer, the disk layer is kept
+        """
+        self._entries = OrderedDict()
+        self._lines = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def __contains__(self, config):
+        key = self.key(config)
+        return any(entry.endswith(key) for entry in self._entries)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+parse_cache = ParseCache()
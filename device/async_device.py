@@ -0,0 +1,212 @@
+import asyncio
+import functools
+import inspect
+import logging
+import sys
+import traceback
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncDevice:
+    """
+    asyncio counterpart of Device, so one event loop can drive the sessions of thousands of devices.
+
+    Methods of the driver defined as coroutines are awaited directly. Blocking drivers, such as the netmiko based
+    IosNapalmWrapper, are called in an executor, so they do not block the event loop.
+
+    Example:
+    async with AsyncDevice("n9k-1", IosNapalmWrapper, username, password) as device:
+        await device.get_config()
+        facts = await device.get_facts()
+        await device.run_cli_command_list(["show vpc"])
+        interfaces = await device.get_interfaces()
+    """
+
+    def __init__(self, hostname, host_type, username, password, timeout=60, optional_args=None, executor=None,
+                 pool=None):
+        """
+        :param hostname: str
+        :param host_type: class of an object with NAPALM like APIs, blocking or with coroutine methods
+        :param username: str
+        :param password: str
+        :param timeout: int
+        :param optional_args: dict
+        :param executor: optional concurrent.futures.Executor the blocking methods of the driver are called in, the
+        default executor of the event loop if None
+        :param pool: optional SessionPool the session is borrowed from, see Device
+        """
+        self.logger = logging.getLogger("device.AsyncDevice")
+        self.logger.info("Instantiating async device object for {}".format(hostname))
+        self.name = hostname
+        self.username = username
+        self.password = password
+        self.optional_args = optional_args
+        self.timeout = timeout
+        self._host_type = host_type
+        if pool is not None and inspect.iscoroutinefunction(getattr(host_type, 'open', None)):
+            # the pool opens sessions with blocking calls, native async drivers open their own
+            pool = None
+        self._pool = pool
+        self._borrowed = False
+        if pool is None:
+            self.connector_object = host_type(hostname, username, password, timeout=timeout,
+                                              optional_args=optional_args)
+        else:
+            # borrowed from the pool in open
+            self.connector_object = None
+        self._executor = executor
+        self._configuration = {}
+        self._running_config = ""
+        self._cli_command_list = {}
+
+    async def _call(self, name, *args, **kwargs):
+        method = getattr(self.connector_object, name)
+        if inspect.iscoroutinefunction(method):
+            return await method(*args, **kwargs)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(method, *args, **kwargs))
+
+    async def open(self):
+        if self._pool is not None:
+            self.logger.info("borrowing connection to {}".format(self.name))
+            # acquire blocks while the host is at the limit of the pool
+            self.connector_object = await asyncio.get_running_loop().run_in_executor(
+                self._executor, functools.partial(self._pool.acquire, self.name, self._host_type, self.username,
+                                                  self.password, timeout=self.timeout,
+                                                  optional_args=self.optional_args))
+            self._borrowed = True
+            return
+        self.logger.info("opening connection to {}".format(self.name))
+        await self._call('open')
+        self.logger.debug("connection to {} opened".format(self.name))
+
+    async def close(self, release=False):
+        """
+        :param release: bool, with a pool, return the session to the pool instead of closing it
+        """
+        if self._pool is None:
+            await self._call('close')
+        elif self._borrowed:
+            self._borrowed = False
+            if release:
+                self._pool.release(self.connector_object)
+            else:
+                self._pool.discard(self.connector_object)
+
+    async def get_config(self, retrieve='all'):
+        """
+        Gets the device's running config
+        :return: None
+        """
+        self.logger.debug("Getting configurations for {}".format(self.name))
+        try:
+            self._configuration = await self._call('get_config', retrieve=retrieve)
+            if retrieve == 'all' or retrieve == 'running':
+                self._running_config = self._configuration['running']
+        except Exception:
+            exc_type, exc_value, exc_traceback = sys.exc_info()
+            stacktrace = traceback.extract_tb(exc_traceback)
+            self.logger.critical("AsyncDevice: get_config: error retrieving configs from: {}".format(self.name))
+            self.logger.debug(sys.exc_info())
+            self.logger.debug(stacktrace)
+            raise
+
+    @property
+    def configuration(self):
+        return self._configuration
+
+    @property
+    def running_config(self):
+        return self._running_config
+
+    async def get_facts(self):
+        return await self._call('get_facts')
+
+    async def cli(self, commands):
+        """
+        :param commands: list of commands
+        :return: dict, command: output
+        """
+        return await self._call('cli', list(commands))
+
+    async def get_cli_command(self, command):
+        """
+
+        :param command:
+        :return:
+        """
+        self.logger.debug("get_cli_command: cmd: {}".format(command))
+        if command not in self._cli_command_list:
+            output = await self._call('_send_command', command)
+            if 'Invalid input detected' in output:
+                self.logger.error("Error running command {}".format(command))
+                raise ValueError('Unable to execute command "{}"'.format(command))
+            self._cli_command_list[command] = output
+        return self._cli_command_list[command]
+
+    @property
+    def cli_command_output(self):
+        return self._cli_command_list
+
+    async def run_cli_command_list(self, commands, pipelined=False):
+        """
+
+        :param commands: list of commands
+        :param pipelined: bool, see Device.run_cli_command_list
+        :return:
+        """
+        commands = list(commands)
+        self.logger.debug("run_cli_command_list: cmd list: {}".format(commands))
+        try:
+            if pipelined and hasattr(self.connector_object, 'cli_pipelined'):
+                self._cli_command_list = await self._call('cli_pipelined', commands)
+            else:
+                self._cli_command_list = await self.cli(commands)
+        except Exception:
+            exc_type, exc_value, exc_traceback = sys.exc_info()
+            stacktrace = traceback.extract_tb(exc_traceback)
+            logger.critical("AsyncDevice: run_cli_command: error retrieving command output from: {}".format(self.name))
+            logger.debug(sys.exc_info())
+            logger.debug(stacktrace)
+            raise
+
+    def __getattr__(self, name):
+        # getters and other methods of the driver, get_interfaces, get_environment, ... as coroutines
+        if name.startswith('_'):
+            raise AttributeError(name)
+        if hasattr(self.connector_object, name):
+            async def method(*args, **kwargs):
+                return await self._call(name, *args, **kwargs)
+            return method
+
+        raise AttributeError(
+            "'{0} object has no attribute '{1}'"
+                .format(self.__class__.__name__, name))
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, exc_traceback):
+        self.logger.debug("Exiting")
+        if exc_type is None:
+            try:
+                await self.close(release=True)
+            except Exception:
+                exc_type, exc_value, exc_traceback = sys.exc_info()
+                stacktrace = traceback.extract_tb(exc_traceback)
+                self.logger.critical("AsyncDevice: error closing napalm/ssh connection to: {}".format(self.name))
+                self.logger.debug(sys.exc_info())
+                self.logger.debug(stacktrace)
+                raise
+        else:
+            self.logger.critical("AsyncDevice: Error with context manager for device {}: {} - {}".format(
+                self.name, exc_type, exc_value))
+            self.logger.debug(exc_traceback)
+            try:
+                # the session is not left open when the collection fails
+                await self.close()
+            except Exception as err:
+                self.logger.debug("AsyncDevice: error closing connection to {}: {}".format(self.name, err))
+        return False
@@ -1,22 +1,43 @@
 import functools
 import logging
 import sys
+import time
 import traceback
 
+import paramiko
+from napalm.base.exceptions import ConnectionException
+
 logger = logging.getLogger(__name__)
 
+# errors of a dead session, the operation is retried once on a new connection
+CONNECTION_ERRORS = (OSError, EOFError, ConnectionException, paramiko.SSHException)
+
 
 def check_connection(func):
+    """
+    Keeps the connection of the Device usable for the decorated call.
+
+    The connection is only probed with is_alive when no operation has succeeded for liveness_window seconds. A
+    call failing with one of CONNECTION_ERRORS reopens the connection and is retried once.
+    """
     @functools.wraps(func)
     def decorator(self, *args, **kwargs):
-        self.logger.debug("instance %s of class %s is now decorated whee!" % (self, self.__class__))
-        self.logger.debug("Checking connection to " + self.name)
         try:
-            is_alive = self.connector_object.is_alive()
-            if not is_alive['is_alive']:
-                self.logger.info("SSH Connection to {} is not alive. Attempting to Open Connection.")
-                self.connector_object.open()
-            value = func(self, *args, **kwargs)
+            if time.monotonic() - self._last_io > self.liveness_window:
+                self.logger.debug("Checking connection to " + self.name)
+                is_alive = self.connector_object.is_alive()
+                if not is_alive['is_alive']:
+                    self.logger.info("SSH Connection to {} is not alive. Attempting to Open Connection.".format(
+                        self.name))
+                    self.connector_object.open()
+            try:
+                value = func(self, *args, **kwargs)
+            except CONNECTION_ERRORS as err:
+                self.logger.warning("Connection to {} failed during {}: {}. Reconnecting and retrying.".format(
+                    self.name, func.__name__, err))
+                self._reconnect()
+                value = func(self, *args, **kwargs)
+            self._last_io = time.monotonic()
             return value
         except:
             exc_type, exc_value, exc_traceback = sys.exc_info()
@@ -29,10 +50,17 @@ def check_connection(func):
 
 
 class Device:
-    def __init__(self, hostname, host_type, username, password, timeout=60, optional_args=None):
+    # seconds after a successful operation during which the connection is assumed alive without probing it
+    LIVENESS_WINDOW = 30
+
+    def __init__(self, hostname, host_type, username, password, timeout=60, optional_args=None, pool=None,
+                 liveness_window=None):
         """
         :param name
         :param driver: String representing a class for an object with NAPALM like APIs
+        :param pool: optional SessionPool. The session is borrowed from the pool when the context is entered and
+        returned to it when the context exits, instead of being opened and closed.
+        :param liveness_window: optional seconds, see check_connection, LIVENESS_WINDOW if None
         """
         self.logger = logging.getLogger("device.Device")
         self.logger.info("Instantiating device object for {}".format(hostname))
@@ -41,7 +69,18 @@ class Device:
         self.password = password
         self.optional_args = optional_args
         self.timeout = timeout
-        self.connector_object = host_type(hostname, username, password, timeout=timeout, optional_args=optional_args)
+        self._host_type = host_type
+        self._pool = pool
+        self._borrowed = False
+        self.liveness_window = self.LIVENESS_WINDOW if liveness_window is None else liveness_window
+        # time of the last successful operation, the connection is probed before the first one
+        self._last_io = float('-inf')
+        if pool is None:
+            self.connector_object = host_type(hostname, username, password, timeout=timeout,
+                                              optional_args=optional_args)
+        else:
+            # borrowed from the pool in __enter__
+            self.connector_object = None
         self._configuration = {}
         self._running_config = ""
         self._cli_command_list = {}
@@ -95,16 +134,21 @@ class Device:
         return self._cli_command_list
 
     @check_connection
-    def run_cli_command_list(self, commands):
+    def run_cli_command_list(self, commands, pipelined=False):
         """
 
         :param commands: list of commands
+        :param pipelined: bool, if True and the driver has cli_pipelined, the commands are written to the channel in
+        batches instead of waiting for the prompt after each one, see IosNapalmWrapper.cli_pipelined
         :return:
         """
         commands = list(commands)
         self.logger.debug("get_cli_command_list: cmd list: {}".format(commands))
         try:
-            self._cli_command_list = self.connector_object.cli(commands)
+            if pipelined and hasattr(self.connector_object, 'cli_pipelined'):
+                self._cli_command_list = self.connector_object.cli_pipelined(commands)
+            else:
+                self._cli_command_list = self.connector_object.cli(commands)
         except:
             exc_type, exc_value, exc_traceback = sys.exc_info()
             stacktrace = traceback.extract_tb(exc_traceback)
@@ -114,7 +158,12 @@ class Device:
             raise
 
     def close(self):
-        self.connector_object.close()
+        if self._pool is None:
+            self.connector_object.close()
+        elif self._borrowed:
+            # a session closed after an error is not lent again
+            self._borrowed = False
+            self._pool.discard(self.connector_object)
 
     def __getattr__(self, name):
         if hasattr(self.connector_object, name):
@@ -128,13 +177,44 @@ class Device:
                 .format(self.__class__.__name__, name))
 
     def __enter__(self):
+        if self._pool is not None:
+            self.logger.info("borrowing connection to {}".format(self.name))
+            self.connector_object = self._pool.acquire(self.name, self._host_type, self.username, self.password,
+                                                       timeout=self.timeout, optional_args=self.optional_args)
+            self._borrowed = True
+            if self._pool.health_check:
+                # checked by the pool when it was lent
+                self._last_io = time.monotonic()
+            return self
         self.logger.info("opening connection to {}".format(self.name))
         self.connector_object.open()
+        self._last_io = time.monotonic()
         self.logger.debug("connection to {} opened".format(self.name))
         return self
 
+    def _reconnect(self):
+        try:
+            self.connector_object.close()
+        except Exception as err:
+            self.logger.debug("Error closing connection to {}: {}".format(self.name, err))
+        self.connector_object.open()
+        self._last_io = time.monotonic()
+
     def __exit__(self, exc_type, exc_value, exc_traceback):
         self.logger.debug("Exiting")
+        if self._pool is not None:
+            if self._borrowed:
+                self._borrowed = False
+                if exc_type is None:
+                    self._pool.release(self.connector_object)
+                else:
+                    # the state of the session is unknown after an error
+                    self._pool.discard(self.connector_object)
+            if exc_type is not None:
+                self.logger.critical("device: Error with context manager for device {}: {} - {}".format(
+                    self.name, exc_type, exc_value))
+                self.logger.debug(exc_traceback)
+            return None
         if exc_type is None:
             try:
                 self.connector_object.close()
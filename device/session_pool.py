@@ -0,0 +1,245 @@
+import atexit
+import hashlib
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class SessionPoolTimeout(Exception):
+    pass
+
+
+class SessionPool:
+    """
+    Process wide pool of open device sessions, so the tasks run against the same devices log in once per device
+    instead of once per task.
+
+    Sessions are driver objects, such as IosNapalmWrapper, keyed by (host, driver, credentials, optional args).
+    Device borrows a session from the pool when its context is entered and returns it when the context exits,
+    instead of opening and closing the connection. An idle session is checked with is_alive before it is lent
+    again and replaced if it is dead. Sessions idle for longer than idle_timeout are closed, and no more than
+    max_per_host sessions are open to the same host; a Device needing one more waits for a session to be returned.
+
+    Example:
+    pool = SessionPool(idle_timeout=600, max_per_host=1)
+    with Device("n9k-1", IosNapalmWrapper, username, password, pool=pool) as device:
+        device.get_config()
+    # the session stays open, the next task borrows it
+    with Device("n9k-1", IosNapalmWrapper, username, password, pool=pool) as device:
+        device.load_merge_candidate(config=config)
+    pool.close_all()
+    """
+
+    def __init__(self, idle_timeout=300, max_per_host=2, health_check=True, wait_timeout=None):
+        """
+        :param idle_timeout: seconds an unused session is kept open
+        :param max_per_host: maximum number of sessions open to one host, borrowed or idle
+        :param health_check: bool, if True, idle sessions are checked with is_alive before they are lent
+        :param wait_timeout: optional seconds to wait for a session of a host at its limit, forever if None
+        """
+        self.idle_timeout = idle_timeout
+        self.max_per_host = max_per_host
+        self.health_check = health_check
+        self.wait_timeout = wait_timeout
+        self._condition = threading.Condition()
+        # key: list of (session, time it was returned), most recently returned last
+        self._idle = {}
+        # id of a borrowed session: key
+        self._borrowed = {}
+        # host: number of sessions open, borrowed or idle
+        self._open = {}
+        self.opened = 0
+        self.reused = 0
+
+    @staticmethod
+    def key(hostname, host_type, username, password, optional_args=None):
+        """
+        :return: tuple identifying the sessions that can be shared, the password is only kept as a digest
+        """
+        digest = hashlib.sha256((password or '').encode('utf-8')).hexdigest()
+        args = tuple(sorted((k, repr(v)) for k, v in (optional_args or {}).items()))
+        return hostname, host_type, username, digest, args
+
+    def acquire(self, hostname, host_type, username, password, timeout=60, optional_args=None):
+        """
+        Lends an open session to the host, opening one if none is idle
+
+        :param hostname: str
+        :param host_type: class of an object with NAPALM like APIs
+        :param username: str
+        :param password: str
+        :param timeout: int, timeout of a new session
+        :param optional_args: dict
+        :return: open driver object, to be returned with release
+        :raises SessionPoolTimeout: if the host is at max_per_host for longer than wait_timeout
+        """
+        key = self.key(hostname, host_type, username, password, optional_args)
+        deadline = None if self.wait_timeout is None else time.monotonic() + self.wait_timeout
+        while True:
+            expired = []
+            session = None
+            with self._condition:
+                while True:
+                    expired.extend(self._expire())
+                    idle = self._idle.get(key)
+                    if idle:
+                        session, _ = idle.pop()
+                        self._borrowed[id(session)] = key
+                        break
+                    if self._open.get(hostname, 0) < self.max_per_host:
+                        # the slot is taken now, the session is opened outside the lock
+                        self._open[hostname] = self._open.get(hostname, 0) + 1
+                        break
+                    # sessions of the host with other credentials are closed to make room
+                    other = self._idle_of_host(hostname)
+                    if other is not None:
+                        expired.append(other)
+                        self._forget(hostname)
+                        continue
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        raise SessionPoolTimeout("No session to {} available after {} seconds".format(
+                            hostname, self.wait_timeout))
+                    self._condition.wait(remaining)
+            self._close(expired)
+            if session is not None:
+                if not self.health_check or self._alive(session):
+                    self.reused += 1
+                    logger.debug("SessionPool: reusing session to {}".format(hostname))
+                    return session
+                logger.info("SessionPool: idle session to {} is dead, opening a new one".format(hostname))
+                self.discard(session)
+                continue
+            return self._open_session(key, hostname, host_type, username, password, timeout, optional_args)
+
+    def _open_session(self, key, hostname, host_type, username, password, timeout, optional_args):
+        try:
+            session = host_type(hostname, username, password, timeout=timeout, optional_args=optional_args)
+            session.open()
+        except Exception:
+            with self._condition:
+                self._forget(hostname)
+            raise
+        with self._condition:
+            self._borrowed[id(session)] = key
+        self.opened += 1
+        logger.debug("SessionPool: opened session to {}".format(hostname))
+        return session
+
+    @staticmethod
+    def _alive(session):
+        try:
+            return session.is_alive()['is_alive']
+        except Exception as err:
+            logger.debug("SessionPool: health check failed: {}".format(err))
+            return False
+
+    def release(self, session):
+        """
+        Returns a borrowed session to the pool
+
+        :param session: driver object returned by acquire
+        """
+        with self._condition:
+            key = self._borrowed.pop(id(session))
+            self._idle.setdefault(key, []).append((session, time.monotonic()))
+            expired = self._expire()
+            self._condition.notify_all()
+        self._close(expired)
+
+    def discard(self, session):
+        """
+        Closes a borrowed session instead of returning it, such as a session whose operation failed
+
+        :param session: driver object returned by acquire
+        """
+        with self._condition:
+            key = self._borrowed.pop(id(session), None)
+            if key is not None:
+                self._forget(key[0])
+        self._close([session])
+
+    def _expire(self):
+        """
+        Removes the sessions idle for longer than idle_timeout, called with the lock held
+
+        :return: list of the sessions to close
+        """
+        now = time.monotonic()
+        expired = []
+        for key in list(self._idle):
+            idle = self._idle[key]
+            kept = [(session, returned) for session, returned in idle if now - returned < self.idle_timeout]
+            for session, returned in idle:
+                if now - returned >= self.idle_timeout:
+                    expired.append(session)
+                    self._forget(key[0])
+            if kept:
+                self._idle[key] = kept
+            else:
+                del self._idle[key]
+        return expired
+
+    def _idle_of_host(self, hostname):
+        """
+        Removes the least recently returned idle session of the host, called with the lock held
+
+        :return: the session or None
+        """
+        for key, idle in self._idle.items():
+            if key[0] == hostname and idle:
+                session, _ = idle.pop(0)
+                if not idle:
+                    del self._idle[key]
+                return session
+        return None
+
+    def _forget(self, hostname):
+        """
+        Frees the slot of a session of the host leaving the pool, called with the lock held
+        """
+        self._open[hostname] -= 1
+        if not self._open[hostname]:
+            del self._open[hostname]
+        self._condition.notify_all()
+
+    @staticmethod
+    def _close(sessions):
+        for session in sessions:
+            try:
+                session.close()
+            except Exception as err:
+                logger.debug("SessionPool: error closing session: {}".format(err))
+
+    def close_idle(self):
+        """
+        Closes the sessions idle for longer than idle_timeout
+        """
+        with self._condition:
+            expired = self._expire()
+        self._close(expired)
+
+    def close_all(self):
+        """
+        Closes every idle session, borrowed sessions are not affected
+        """
+        with self._condition:
+            sessions = []
+            for key, idle in self._idle.items():
+                for session, _ in idle:
+                    sessions.append(session)
+                    self._forget(key[0])
+            self._idle = {}
+        self._close(sessions)
+
+    def report(self):
+        with self._condition:
+            return {'idle': sum(len(idle) for idle in self._idle.values()), 'borrowed': len(self._borrowed),
+                    'opened': self.opened, 'reused': self.reused}
+
+
+# process wide pool used by the tasks
+session_pool = SessionPool()
+atexit.register(session_pool.close_all)
@@ -0,0 +1,173 @@
+import logging
+
+from configuration.config_tree import ConfigTree
+from configuration.keyword_index import KeywordIndex
+from configuration.multi_pattern import MultiPatternMatcher, get_matcher
+
+logger = logging.getLogger(__name__)
+
+class ScannedConfig:
+    """
+    Wraps a CiscoConfParse or ConfigTree object with the lines matching every pattern of a ScanPlan, found in a
+    single pass over the configuration.
+
+    find_objects and find_objects_w_child are answered from the scan when the regex is part of the plan. Other
+    regexes are answered from a KeywordIndex of the configuration, so an anchored regex only tests the lines
+    starting with its keyword. Every other attribute is passed through to the parse. commit rescans the
+    configuration, so the scan stays current when update_config modifies the configuration.
+
+    Created with a load function instead of a parse, the configuration is only parsed and scanned the first time a
+    condition uses it, so rules decided by command output, getters or facts alone never parse it.
+    """
+
+    def __init__(self, parse, plan, load=None):
+        """
+        :param parse: CiscoConfParse or ConfigTree object, None with load
+        :param plan: ScanPlan
+        :param load: optional function returning the parse, called on first use
+        """
+        self._plan = plan
+        self._load = load
+        if load is None:
+            self.parse = parse
+            self._index()
+
+    @property
+    def loaded(self):
+        """
+        False until a lazily loaded configuration is used
+        """
+        return self._load is None
+
+    def _index(self):
+        if isinstance(self.parse, ConfigTree):
+            self._objects = None
+            self._keywords = self.parse.keywords
+        else:
+            self._objects = list(self.parse.ConfigObjs)
+            self._keywords = None
+        self._buckets = self._plan.bucket(self.parse)
+
+    @property
+    def keywords(self):
+        """
+        KeywordIndex of the configuration lines, built on first use
+        """
+        if self._keywords is None:
+            self._keywords = KeywordIndex([obj.text for obj in self._objects])
+        return self._keywords
+
+    def _line(self, i):
+        if self._objects is None:
+            return self.parse.line(i)
+        return self._objects[i]
+
+    def find_objects(self, linespec, exactmatch=False, ignore_ws=False):
+        if exactmatch or ignore_ws:
+            return self.parse.find_objects(linespec, exactmatch=exactmatch, ignore_ws=ignore_ws)
+        if linespec in self._buckets:
+            return list(self._buckets[linespec])
+        return [self._line(i) for i in self.keywords.search(linespec)]
+
+    def find_objects_many(self, patterns):
+        """
+        :param patterns: list of regex strings
+        :return: list of lists of line objects, one per pattern
+        """
+        missing = [pattern for pattern in patterns if pattern not in self._buckets]
+        if len(missing) > 1:
+            found = get_matcher(missing).match(self.keywords.texts)
+            self._buckets.update({pattern: [self._line(i) for i in found[pattern]] for pattern in missing})
+        return [self.find_objects(pattern) for pattern in patterns]
+
+    def find_objects_w_child(self, parentspec, childspec, ignore_ws=False):
+        if ignore_ws:
+            return self.parse.find_objects_w_child(parentspec, childspec, ignore_ws=ignore_ws)
+        return [obj for obj in self.find_objects(parentspec) if obj.re_search_children(childspec)]
+
+    def commit(self):
+        self.parse.commit()
+        self._index()
+
+    def load(self):
+        """
+        Parses and scans a lazily loaded configuration now instead of on first use
+        """
+        load = self.__dict__.get('_load')
+        if load is not None:
+            self.parse = load()
+            self._load = None
+            self._index()
+            logger.debug("ScannedConfig: configuration loaded")
+
+    def __getattr__(self, name):
+        if self.__dict__.get('_load') is not None:
+            # first use, the parse and the scan are built and the attribute looked up again
+            self.load()
+            return getattr(self, name)
+        if name == 'parse':
+            raise AttributeError(name)
+        return getattr(self.parse, name)
+
+
+class ScanPlan:
+    """
+    The distinct regexes the configuration conditions of a rule set pass to parse.find_objects.
+
+    The lines matching every regex are found in a single sweep over the configuration with a MultiPatternMatcher,
+    so the global one liners of a compliance pack, ^logging server, ^ntp server, ^feature vpc, cost one pass
+    instead of one pass each.
+    """
+
+    def __init__(self, patterns):
+        self._matcher = MultiPatternMatcher(patterns)
+        self.patterns = self._matcher.patterns
+        logger.debug("ScanPlan: {} patterns".format(len(self.patterns)))
+
+    def scan(self, parse=None, load=None):
+        """
+        :param parse: CiscoConfParse or ConfigTree object
+        :param load: optional function returning the parse, the configuration is parsed on first use
+        :return: ScannedConfig
+        """
+        return ScannedConfig(parse, self, load=load)
+
+    def bucket(self, parse):
+        """
+        Walks the configuration once and buckets the lines matching each pattern
+
+        :param parse: CiscoConfParse or ConfigTree object
+        :return: dict, pattern: list of IOSCfgLine or ConfigLine objects in configuration order
+        """
+        if isinstance(parse, ConfigTree):
+            texts = parse.texts
+            line = parse.line
+        else:
+            objects = list(parse.ConfigObjs)
+            texts = [obj.text for obj in objects]
+            line = objects.__getitem__
+        found = self._matcher.match(texts) if self.patterns else {}
+        # only the matching lines of a ConfigTree are materialized
+        return {pattern: [line(i) for i in indexes] for pattern, indexes in found.items()}
+
+    def __len__(self):
+        return len(self.patterns)
+
+
+def compile_rule_set(rules):
+    """
+    Collects the find_objects regexes of every configuration condition of the rules into a ScanPlan
+
+    :param rules: dictionary of rule objects, such as abs_task.loaded_rules
+    :return: ScanPlan
+    """
+    patterns = []
+    for name, rule in rules.items():
+        expression = getattr(rule, 'expression', None)
+        if expression is None:
+            continue
+        for token in expression.operands():
+            if hasattr(token.value, 'scan_patterns'):
+                patterns.extend(token.value.scan_patterns())
+    logger.debug("compile_rule_set: patterns: {}".format(patterns))
+    return ScanPlan(patterns)
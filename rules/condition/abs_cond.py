@@ -1,7 +1,61 @@
 import abc
+import re
+
+from rules.condition.regex_registry import registry
+
+# Relative cost of evaluating a condition, cheapest first. Rules evaluate their cheapest conditions first and
+# CLI output and getters are only collected for devices where a rule is still undecided after the cheap ones.
+COST_CONFIG = 10  # regex over the running configuration
+COST_FSM = 20  # TextFSM parse of command output
+COST_GETTER = 30  # NAPALM getter
+COST_CLI = 40  # CLI round trip
+
+
+def has_child(obj, compiled):
+    """
+    Same as bool(obj.re_search_children(regex)) with a compiled regex
+
+    :param obj: IOSCfgLine object
+    :param compiled: compiled regex
+    :return: bool
+    """
+    for child in obj.children:
+        if compiled.search(child.text):
+            return True
+    return False
+
+
+def _freeze(value):
+    """
+    Converts lists and dictionaries to tuples so the value can be used in a dictionary key.
+    (True, "^logging") and [True, "^logging"] are frozen to the same value.
+    """
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(v) for v in value)
+    if isinstance(value, dict):
+        return tuple((_freeze(k), _freeze(v)) for k, v in value.items())
+    return value
+
+
+def _intern(value):
+    """
+    Replaces the compiled regexes in value, including those nested in lists and tuples, with the registered ones
+    """
+    if isinstance(value, re.Pattern):
+        return registry.intern(value)
+    if isinstance(value, list):
+        return [_intern(v) for v in value]
+    if isinstance(value, tuple) and not hasattr(value, '_fields'):
+        return tuple(_intern(v) for v in value)
+    return value
 
 
 class AbsCondition(metaclass=abc.ABCMeta):
+    # attributes that determine what the condition evaluates. Conditions that list them have a signature and their
+    # results can be shared by every rule that uses an equivalent condition
+    _signature_attrs = ()
+    cost = COST_CONFIG
+
     def __init__(self, name):
         self.name = name
         self.need_cli = False
@@ -9,10 +63,41 @@ class AbsCondition(metaclass=abc.ABCMeta):
         self._command_list = []
         self._get_list = []
 
+    @property
+    def signature(self):
+        """
+        Hashable key made from the class and the regexes of the condition, but not its name. Two conditions with
+        the same signature return the same result for the same configuration.
+
+        Match("bgp_router", "global", "^router\s+bgp").signature
+        ('Match', 'global', ((True, '^router\\s+bgp'),))
+
+        :return: tuple or None if the condition cannot be shared
+        """
+        if not self._signature_attrs:
+            return None
+        return (self.__class__.__name__,) + tuple(_freeze(getattr(self, attr)) for attr in self._signature_attrs)
+
+    def __setstate__(self, state):
+        self.__dict__.update({key: _intern(value) for key, value in state.items()})
+
+    @staticmethod
+    def _compile(pattern):
+        return registry.compile(pattern)
+
+    def scan_patterns(self):
+        """
+        Regexes this condition passes to parse.find_objects. The rule set compiler finds the lines matching all of
+        them in a single pass over the configuration.
+
+        :return: list of regex strings
+        """
+        return []
+
     @abc.abstractmethod
     def __str__(self):
         """required method"""
 
     @abc.abstractmethod
     def run(self, parse):
-        """required method"""
\ No newline at end of file
+        """required method"""
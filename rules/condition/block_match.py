@@ -6,6 +6,8 @@ logger = logging.getLogger('blockmatch')
 
 
 class BlockMatch(AbsCondition):
+    _signature_attrs = ('block_regex',)
+
     def __init__(self, name, block_regex):
         """
 
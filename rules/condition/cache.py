@@ -0,0 +1,88 @@
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class ConditionCache:
+    """
+    Memoizes the results of configuration conditions for a device.
+
+    Results are keyed by the signature of the condition and the identity of the parsed configuration, so each
+    distinct condition is evaluated once per parsed config no matter how many rules reference it. For example,
+    Match("bgp_router", "global", "^router\s+bgp") and Match("bgp", "global", (True, r"^router\s+bgp")) share one
+    result.
+
+    A reference to every parse seen is kept so its id cannot be reused while the cache is alive.
+    """
+
+    def __init__(self):
+        self._results = {}
+        self._parses = {}
+        self._conditions = {}
+        self.hits = 0
+        self.misses = 0
+
+    def run(self, condition, parse):
+        """
+        Returns the cached (result, results) of condition.run(parse), running the condition if needed
+
+        :param condition: AbsCondition
+        :param parse: CiscoConfParse object
+        :return: tuple, (result, results)
+        """
+        signature = condition.signature
+        if signature is None:
+            return condition.run(parse)
+        key = (id(parse), signature)
+        try:
+            answer = self._results[key]
+            self.hits += 1
+            logger.debug("ConditionCache: hit for {}: {}".format(condition.name, signature))
+        except KeyError:
+            self.misses += 1
+            answer = condition.run(parse)
+            self._results[key] = answer
+            self._parses[id(parse)] = parse
+            self._conditions[signature] = condition
+        return answer
+
+    def carry_forward(self, old_parse, new_parse, delta):
+        """
+        Builds the cache for a new parse of the configuration of the device from the results computed for the
+        previous parse. A result is kept when none of the regexes its condition scans for (see
+        AbsCondition.scan_patterns) match a line in a block that changed. Its IOSCfgLine objects are replaced with
+        the ones of the new parse.
+
+        Conditions without scan patterns, such as BlockMatch, are only kept when the configuration did not change.
+
+        :param old_parse: parse the results were computed for
+        :param new_parse: parse of the new configuration
+        :param delta: ConfigDelta between the two parses
+        :return: ConditionCache
+        """
+        cache = ConditionCache()
+        for (parse_id, signature), (result, results) in self._results.items():
+            if parse_id != id(old_parse):
+                continue
+            condition = self._conditions[signature]
+            if not delta.unchanged:
+                patterns = condition.scan_patterns()
+                if not patterns or delta.affects(patterns):
+                    continue
+            try:
+                results = delta.remap(results)
+            except KeyError:
+                continue
+            cache._results[(id(new_parse), signature)] = (result, results)
+            cache._conditions[signature] = condition
+        cache._parses[id(new_parse)] = new_parse
+        logger.debug("ConditionCache: carried forward {} of {} results".format(len(cache), len(self)))
+        return cache
+
+    def clear(self):
+        self._results = {}
+        self._parses = {}
+        self._conditions = {}
+
+    def __len__(self):
+        return len(self._results)
@@ -1,5 +1,4 @@
 import logging
-import re
 
 from rules.condition.abs_cond import AbsCondition
 
@@ -7,6 +6,8 @@ logger = logging.getLogger('childmatch')
 
 
 class ChildMatch(AbsCondition):
+    _signature_attrs = ('parent_regex', 'child_regex')
+
     def __init__(self, name, parent_regex, child_regex):
         """
         Provide a parent regex string such as "interface" that identifies a configuration block
@@ -27,11 +28,15 @@ class ChildMatch(AbsCondition):
         logger.debug("ChildMatch: __init__: {}".format(self.parent_regex))
         self.child_regex = child_regex
         logger.debug("ChildMatch: __init__: self.child_regex {}".format(self.child_regex))
+        self._compiled_child = self._compile(self.child_regex)
 
     def __str__(self):
         line = "parent: {}, child {}".format(self.parent_regex, self.child_regex)
         return line
 
+    def scan_patterns(self):
+        return [self.parent_regex]
+
     def run(self, parse):
         parent = self.parent_regex
         child = self.child_regex
@@ -42,9 +47,9 @@ class ChildMatch(AbsCondition):
         logger.debug("_child_parse: parent: {}, objs {}".format(parent, objs))
         for object in objs:
             logger.debug("_child_parse: object.text: {}".format(object.text))
-            lineobj = object.re_search_children(child)
+            lineobj = [c for c in object.children if self._compiled_child.search(c.text)]
             logger.debug("_child_parse: lineobj: {}, lineobj[0].text".format(lineobj, lineobj[0].text))
-            children = re.search(child, lineobj[0].text)
+            children = self._compiled_child.search(lineobj[0].text)
             logger.debug("_child_parse: children: {}".format(children.groups()))
             if children.groups():
                 answers['children'][object.text] = children.groups()
@@ -4,12 +4,14 @@ from io import StringIO
 import textfsm
 
 from configuration.helpers import json_xpath
-from rules.condition.abs_cond import AbsCondition
+from rules.condition.abs_cond import AbsCondition, COST_FSM
 
 logger = logging.getLogger('command_fsm_parser')
 
 
 class CmdFsmParse(AbsCondition):
+    cost = COST_FSM
+
     def __init__(self, name, cmdlist):
         super().__init__(name)
         self.parselist = cmdlist  # list of tuples
@@ -1,8 +1,9 @@
 import logging
-import re
 
 from rules.absrule import AbsRule
-from rules.condition.abs_cond import AbsCondition
+from rules.condition.abs_cond import AbsCondition, COST_CLI
+from rules.condition.comparator import get_comparator
+from rules.condition.regex_registry import registry
 
 logger = logging.getLogger('command_parser')
 
@@ -20,7 +21,7 @@ class Configparse(str):
     def exist(self, pat):
         ##        print(self)
         ##        print(pat)
-        if re.search(pat, self):
+        if registry.compile(pat).search(self):
             return True
         else:
             return False
@@ -44,7 +45,7 @@ class Configparse(str):
         return self._result
 
     def count(self, pat):
-        return len(re.findall(pat, self))
+        return len(registry.compile(pat).findall(self))
 
     def countl(self, list_pat):
         self._result = []
@@ -53,11 +54,11 @@ class Configparse(str):
         return self._result
 
     def countcmpl(self, list_pat, mult=1):
-        self._count = len(re.findall(list_pat[0], self))
+        self._count = len(registry.compile(list_pat[0]).findall(self))
         self._result = []
         try:
             for pat in list_pat[1:]:
-                if len(re.findall(pat, self)) * mult != self._count:
+                if len(registry.compile(pat).findall(self)) * mult != self._count:
                     self._result.append(False)
                     return self._result
             if self._count == 0:
@@ -69,10 +70,10 @@ class Configparse(str):
             return "Error:  Problem in the Pattern List"
 
     def searchpat(self, pat):
-        return re.search(pat, self)
+        return registry.compile(pat).search(self)
 
     def searchall(self, pat):
-        return re.findall(pat, self)
+        return registry.compile(pat).findall(self)
 
 
 def commandparse(output, pattern_dic):
@@ -122,7 +123,7 @@ def commandparse(output, pattern_dic):
             nums = [j for i, j in pat]
             resultp = output.countl(pats)
             try:
-                result = map((lambda r, op: eval(str(float(r)) + op)), resultp, nums)
+                result = [get_comparator(op)(float(r)) for r, op in zip(resultp, nums)]
             except:
                 result = ["Error in List or Regular Expression"]
         elif flag == 'countcmpnumzl':
@@ -131,7 +132,7 @@ def commandparse(output, pattern_dic):
             nums = [j for i, j in pat]
             resultp = output.countl(pats)
             try:
-                result = map((lambda r, op: eval(str(float(r)) + op) or r == 0), resultp, nums)
+                result = [get_comparator(op)(float(r)) or r == 0 for r, op in zip(resultp, nums)]
             except:
                 result = ["Error in List or Regular Expression"]
         elif flag == 'numcmpl':
@@ -146,9 +147,9 @@ def commandparse(output, pattern_dic):
             fail = 0
             m = 0
             for rl in resultp:
-                op = nums[m]
+                comparator = get_comparator(nums[m])
                 for r in rl:
-                    if not eval(str(float(r)) + op):
+                    if not comparator(float(r)):
                         fail = 1
                 m += 1
                 if fail:
@@ -266,6 +267,7 @@ class CmdParse(AbsCondition):
                     }
     }
     """
+    cost = COST_CLI
 
     def __init__(self, name, parselist):
         """
@@ -279,6 +281,29 @@ class CmdParse(AbsCondition):
         logger.debug("CmdParse: __init__: parselist: {}".format(parselist))
         self._command_list = list(parselist.keys())
         logger.debug("_command_list: {}".format(self._command_list))
+        self._compile_patterns()
+
+    def _compile_patterns(self):
+        """
+        Registers every pattern of the parselist with the regex registry, and parses every comparison, when the
+        condition is built
+        """
+        for flags in self.parselist.values():
+            if flags is None:
+                continue
+            for flag, pat in flags.items():
+                if flag in ('exist', 'notexist', 'count'):
+                    self._compile(pat)
+                elif flag in ('existl', 'notexistl', 'countl'):
+                    for p in pat:
+                        self._compile(p)
+                elif flag == 'countcmpl':
+                    for p in pat[0]:
+                        self._compile(p)
+                elif flag in ('countcmpnuml', 'countcmpnumzl', 'numcmpl'):
+                    for p, op in pat:
+                        self._compile(p)
+                        get_comparator(op)
 
     def __str__(self):
         line = "CmdParse: name: {}, parselist: {}".format(self.name, self.parselist)
@@ -0,0 +1,86 @@
+import logging
+import operator
+
+logger = logging.getLogger(__name__)
+
+# two character operators first, so '>=' is not read as '>'
+OPERATORS = [('==', operator.eq), ('!=', operator.ne), ('>=', operator.ge), ('<=', operator.le),
+             ('>', operator.gt), ('<', operator.lt)]
+_OPERATOR_FUNCS = dict(OPERATORS)
+
+
+def _number(text):
+    try:
+        return int(text)
+    except ValueError:
+        return float(text)
+
+
+class Comparator:
+    """
+    A comparison such as "< 2" or "> 16000000", parsed once into an operator function and a constant.
+
+    Examples:
+    less_than_two = Comparator("< 2")
+    less_than_two(1)
+    True
+    Comparator(">1")(1.0)
+    False
+    """
+
+    def __init__(self, expression):
+        self.expression = expression
+        text = expression.strip()
+        for symbol, func in OPERATORS:
+            if text.startswith(symbol):
+                self.operator = symbol
+                self._func = func
+                try:
+                    self.constant = _number(text[len(symbol):].strip())
+                except ValueError:
+                    raise ValueError("Invalid constant in comparison {}".format(expression))
+                break
+        else:
+            raise ValueError("Unsupported comparison {}, must start with one of {}".format(
+                expression, [symbol for symbol, _ in OPERATORS]))
+
+    def __call__(self, value):
+        return self._func(value, self.constant)
+
+    def __str__(self):
+        return "{} {}".format(self.operator, self.constant)
+
+    def __repr__(self):
+        return "Comparator({!r})".format(self.expression)
+
+
+_comparators = {}
+
+
+def get_comparator(expression):
+    """
+    Returns the Comparator for the expression, parsing it only the first time it is seen
+
+    :param expression: str, such as "< 2"
+    :return: Comparator
+    """
+    try:
+        return _comparators[expression]
+    except KeyError:
+        comparator = Comparator(expression)
+        _comparators[expression] = comparator
+        return comparator
+
+
+def compare(symbol, left, right):
+    """
+    Evaluates left <symbol> right without eval
+
+    :param symbol: str, one of ==, !=, >=, <=, >, <
+    :return: bool
+    """
+    try:
+        func = _OPERATOR_FUNCS[symbol]
+    except KeyError:
+        raise ValueError("Unsupported operator {}".format(symbol))
+    return func(left, right)
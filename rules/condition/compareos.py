@@ -1,8 +1,13 @@
 import logging
 
+from rules.condition.abs_cond import COST_CONFIG
+
 logger = logging.getLogger('comapareos')
 
 class CompareOS:
+    # the device facts are collected with the configuration
+    cost = COST_CONFIG
+
     def __init__(self, operator, cmp_string):
         """
         The goal is to provide a comparison with running software on a device to some reference
@@ -1,9 +1,14 @@
 import logging
 
+from rules.condition.abs_cond import AbsCondition, has_child
+from rules.condition.comparator import Comparator
+
 logger = logging.getLogger('count')
 
 
-class Count:
+class Count(AbsCondition):
+    _signature_attrs = ('parent_regex', 'child_regex')
+
     def __init__(self, name, parent_regex, child_regex):
         """
         Examples:
@@ -27,11 +32,18 @@ class Count:
             else:
                 logger.debug("Count: __init__: no match on child regex {}".format(child_regex))
         logger.debug("Count: __init__: self.child_regexes {}".format(self.child_regex))
+        self._compiled_child = self._compile(self.child_regex[1])
+        self._comparator = Comparator(self.child_regex[2])
 
     def __str__(self):
         line = "parent: {}, child {}".format(self.parent_regex, self.child_regex)
         return line
 
+    def scan_patterns(self):
+        if 'global' in self.parent_regex.lower():
+            return [self.child_regex[1]]
+        return [self.parent_regex]
+
     def run(self, parse):
         """
 
@@ -52,21 +64,21 @@ class Count:
                 logger.debug("_count: global child answer: {}".format(answer))
             if not b:
                 raise SyntaxError("Unsupported Count Opotion: False is unsupported if parent is global")
-            result = eval('{} {}'.format(answer, d))
+            result = self._comparator(answer)
             logger.debug("_count: global: answer {}".format(result))
         else:
             objs = parse.find_objects(parent)
             b, c, d = child
             logger.debug("_count: child b {}, c {}, d {}".format(b, c, d))
             if b:
-                objs = [obj for obj in objs if obj.re_search_children(c)]
+                objs = [obj for obj in objs if has_child(obj, self._compiled_child)]
             else:
-                objs = [obj for obj in objs if not obj.re_search_children(c)]
+                objs = [obj for obj in objs if not has_child(obj, self._compiled_child)]
             logger.debug("_count: new objs {}".format(objs))
             logger.debug("_count: parent: {}, objs {}".format(parent, objs))
             results.append(objs)
             answer = len(objs)
-            result = eval('{} {}'.format(answer, d))
+            result = self._comparator(answer)
             logger.debug("_count: result: {}".format(result))
         logger.debug("_count: final result {}".format(result))
         return str(result), results
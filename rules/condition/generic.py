@@ -1,5 +1,7 @@
 import logging
 
+from rules.condition.abs_cond import COST_CLI, COST_CONFIG
+
 logger = logging.getLogger('generic')
 
 class GenericFunction:
@@ -8,6 +10,12 @@ class GenericFunction:
         self.func = func
         self._command_list = []
 
+    @property
+    def cost(self):
+        if self._command_list:
+            return COST_CLI
+        return COST_CONFIG
+
     @property
     def command_list(self):
         return self._command_list
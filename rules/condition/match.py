@@ -1,11 +1,14 @@
 import logging
 
-from rules.condition.abs_cond import AbsCondition
+from configuration.multi_pattern import find_objects_many
+from rules.condition.abs_cond import AbsCondition, has_child
 
 logger = logging.getLogger(__name__)
 
 
 class Match(AbsCondition):
+    _signature_attrs = ('parent_regex', 'child_regexes')
+
     def __init__(self, name, parent_regex, child_regexes):
         """
 
@@ -60,11 +63,17 @@ class Match(AbsCondition):
                 else:
                     logger.debug("Match: __init__: no match on child regex {}".format(regex))
         logger.debug("Match: __init__: self.child_regexes {}".format(self.child_regexes))
+        self._compiled_children = [(b, self._compile(c)) for b, c in self.child_regexes]
 
     def __str__(self):
         line = "parent: {}, child {}".format(self.parent_regex, self.child_regexes)
         return line
 
+    def scan_patterns(self):
+        if 'global' in self.parent_regex.lower():
+            return [c for b, c in self.child_regexes]
+        return [self.parent_regex]
+
     def run(self, parse):
         results = []
         parent = self.parent_regex
@@ -74,9 +83,10 @@ class Match(AbsCondition):
         # if there are multiple children in a Match object, the parent object is pulled and then checked for each child, if there are
         # any parent objects left after running them against all children, a True is returned
         if 'global' in parent.lower():
-            for b, c in children:
+            # the lines matching every child regex are found in one pass over the configuration
+            found = find_objects_many(parse, [c for b, c in children])
+            for (b, c), answer in zip(children, found):
                 logger.debug("_confparsed_config: global child b {}, c {}".format(b, c))
-                answer = parse.find_objects(c)
                 results.append(answer)
                 answer = bool(answer)
                 logger.debug("_confparsed_config: global child answer: {}".format(answer))
@@ -87,12 +97,12 @@ class Match(AbsCondition):
                 logger.debug("_confparsed_config: global: result: {}".format(result))
         else:
             objs = parse.find_objects(parent)
-            for b, c in children:
-                logger.debug("_confparsed_config: child b {}, c {}".format(b, c))
+            for b, c in self._compiled_children:
+                logger.debug("_confparsed_config: child b {}, c {}".format(b, c.pattern))
                 if b:
-                    objs = [obj for obj in objs if obj.re_search_children(c)]
+                    objs = [obj for obj in objs if has_child(obj, c)]
                 else:
-                    objs = [obj for obj in objs if not obj.re_search_children(c)]
+                    objs = [obj for obj in objs if not has_child(obj, c)]
                 logger.debug("_confparsed_config: new objs {}".format(objs))
             logger.debug("_confparsed_config: parent: {}, objs {}".format(parent, objs))
             results.append(objs)
@@ -2,12 +2,14 @@ import logging
 from abc import ABC
 
 from configuration.helpers import json_xpath
-from rules.condition.abs_cond import AbsCondition
+from rules.condition.abs_cond import AbsCondition, COST_GETTER
 
 logger = logging.getLogger('napalm_get')
 
 
 class NapalmGet(AbsCondition, ABC):
+    cost = COST_GETTER
+
     def __init__(self, name, command):
         super().__init__(name)
         self._command = command   #list of tuples [(get_command, json_path)]
@@ -1,12 +1,14 @@
 import logging
-import re
 
-from rules.condition.abs_cond import AbsCondition
+from configuration.multi_pattern import find_objects_many
+from rules.condition.abs_cond import AbsCondition, has_child
 
 logger = logging.getLogger(__name__)
 
 
 class ParentChildMatch(AbsCondition):
+    _signature_attrs = ('parent_regex', 'child_regexes', 'child_match_regexes')
+
     def __init__(self, name, parent_regex, child_filter_regexes=None, child_match_regexes=None):
         """
 
@@ -74,11 +76,18 @@ class ParentChildMatch(AbsCondition):
         if isinstance(child_match_regexes, str):
             self.child_match_regexes = [child_match_regexes]
         logger.debug("Parent_and_Child_Match: __init__: self.child_match_regexes {}".format(self.child_match_regexes))
+        self._compiled_children = [(b, self._compile(c)) for b, c in self.child_regexes]
+        self._compiled_child_matches = [self._compile(c) for c in self.child_match_regexes or []]
 
     def __str__(self):
         line = "parent: {}, child filter regexes {}, child match regexes".format(self.parent_regex, self.child_regexes, self.child_match_regexes)
         return line
 
+    def scan_patterns(self):
+        if 'global' in self.parent_regex.lower():
+            return [c for b, c in self.child_regexes]
+        return [self.parent_regex]
+
     def run(self, parse):
         results = []
         parent = self.parent_regex
@@ -88,9 +97,10 @@ class ParentChildMatch(AbsCondition):
         # if there are multiple children in a Match object, the parent object is pulled and then checked for each child, if there are
         # any parent objects left after running them against all children, a True is returned
         if 'global' in parent.lower():
-            for b, c in children:
+            # the lines matching every child regex are found in one pass over the configuration
+            found = find_objects_many(parse, [c for b, c in children])
+            for (b, c), answer in zip(children, found):
                 logger.debug("_confparsed_config: global child b {}, c {}".format(b, c))
-                answer = parse.find_objects(c)
                 results.append(answer)
                 answer = bool(answer)
                 logger.debug("_confparsed_config: global child answer: {}".format(answer))
@@ -101,12 +111,12 @@ class ParentChildMatch(AbsCondition):
                 logger.debug("_confparsed_config: global: result: {}".format(result))
         else:
             objs = parse.find_objects(parent)
-            for b, c in children:
-                logger.debug("_confparsed_config: child b {}, c {}".format(b, c))
+            for b, c in self._compiled_children:
+                logger.debug("_confparsed_config: child b {}, c {}".format(b, c.pattern))
                 if b:
-                    objs = [obj for obj in objs if obj.re_search_children(c)]
+                    objs = [obj for obj in objs if has_child(obj, c)]
                 else:
-                    objs = [obj for obj in objs if not obj.re_search_children(c)]
+                    objs = [obj for obj in objs if not has_child(obj, c)]
                 logger.debug("_confparsed_config: new objs {}".format(objs))
             logger.debug("_confparsed_config: parent: {}, objs {}".format(parent, objs))
             results.append(objs)
@@ -122,14 +132,14 @@ class ParentChildMatch(AbsCondition):
                 for object in objects:
                     logger.debug("object: {}".format(object))
                     answers['children'][object.text] = []
-                    for child in self.child_match_regexes:
+                    for child in self._compiled_child_matches:
                         logger.debug("_parent_child_parse: object.text: {}".format(object.text))
-                        logger.debug("child match regex: {}".format(child))
-                        lineobj = object.re_search_children(child)
+                        logger.debug("child match regex: {}".format(child.pattern))
+                        lineobj = [c for c in object.children if child.search(c.text)]
                         logger.debug("_parent_child_parse: lineobj: {}".format(lineobj))
                         if lineobj:
                             logger.debug("_parent_child_parse: lineobj[0].text: {}".format(lineobj[0].text))
-                            children = [re.search(child, obj.text) for obj in lineobj]
+                            children = [child.search(obj.text) for obj in lineobj]
                             children_groups = []
                             if children:
                                 children_groups = [child.groups() for child in children]
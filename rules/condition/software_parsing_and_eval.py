@@ -1,5 +1,7 @@
 import logging
 
+from rules.condition.comparator import compare
+
 logger = logging.getLogger('software_parsing_and_eval')
 
 # Token types
@@ -156,11 +158,11 @@ def _parser_helper(sw1, sw2, operator):
         print("a: {}, b: {}".format(a, b))
         if (a.type != EOF and b.type != EOF) and compare_token_types(a, b):
             if a.type == INTEGER or a.type == CHAR:
-                result = eval("{} {} {}".format(a.value, operator, b.value))
+                result = compare(operator, a.value, b.value)
                 print(result)
                 if result and not_equal_flag:
                     return True
-                elif eval("{} {} {}".format(a.value, '==', b.value)):
+                elif a.value == b.value:
                     if (not tsw1.current_char or not tsw2.current_char) and not_equal_flag:
                         return False
                     elif not tsw1.current_char or not tsw2.current_char:
@@ -0,0 +1,201 @@
+import logging
+
+from rules.condition.abs_cond import COST_CONFIG
+
+logger = logging.getLogger(__name__)
+
+OPERATORS = ('and', 'or', 'not', '(', ')')
+
+
+def as_bool(result):
+    """
+    Conditions report their result as the strings 'True' or 'False' (a holdover from building a string for eval),
+    CompareOS reports a bool. Normalize both to a bool.
+
+    :param result: str or bool
+    :return: bool
+    """
+    if isinstance(result, str):
+        return result.strip() == 'True'
+    return bool(result)
+
+
+class Operand:
+    """
+    Leaf of the expression tree, wraps a single condition token
+    """
+    def __init__(self, token):
+        self.token = token
+        self.cost = getattr(token.value, 'cost', COST_CONFIG)
+
+    def evaluate(self, resolve):
+        return resolve(self.token)
+
+    def operands(self):
+        yield self.token
+
+    def __str__(self):
+        return "{}({})".format(self.token.name, getattr(self.token.value, 'name', self.token.value))
+
+
+class Not:
+    def __init__(self, operand):
+        self.operand = operand
+        self.cost = operand.cost
+
+    def evaluate(self, resolve):
+        result = self.operand.evaluate(resolve)
+        if result is None:
+            return None
+        return not result
+
+    def operands(self):
+        yield from self.operand.operands()
+
+    def __str__(self):
+        return "not {}".format(self.operand)
+
+
+class And:
+    def __init__(self, operands):
+        self.children = sorted(operands, key=lambda child: child.cost)
+        self.cost = self.children[-1].cost
+
+    def evaluate(self, resolve):
+        undecided = False
+        for child in self.children:
+            result = child.evaluate(resolve)
+            if result is None:
+                undecided = True
+            elif not result:
+                return False
+        if undecided:
+            return None
+        return True
+
+    def operands(self):
+        for child in self.children:
+            yield from child.operands()
+
+    def __str__(self):
+        return "({})".format(" and ".join(str(child) for child in self.children))
+
+
+class Or:
+    def __init__(self, operands):
+        self.children = sorted(operands, key=lambda child: child.cost)
+        self.cost = self.children[-1].cost
+
+    def evaluate(self, resolve):
+        undecided = False
+        for child in self.children:
+            result = child.evaluate(resolve)
+            if result is None:
+                undecided = True
+            elif result:
+                return True
+        if undecided:
+            return None
+        return False
+
+    def operands(self):
+        for child in self.children:
+            yield from child.operands()
+
+    def __str__(self):
+        return "({})".format(" or ".join(str(child) for child in self.children))
+
+
+class _Parser:
+    """
+    Recursive descent parser over the token list built by Rule._tokenize. Precedence follows python: not binds
+    tighter than and, and binds tighter than or.
+
+    expr   := term ('or' term)*
+    term   := factor ('and' factor)*
+    factor := 'not' factor | '(' expr ')' | operand
+    """
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.pos = 0
+
+    def peek(self):
+        if self.pos < len(self.tokens):
+            return self.tokens[self.pos].name
+        return None
+
+    def advance(self):
+        token = self.tokens[self.pos]
+        self.pos += 1
+        return token
+
+    def parse(self):
+        if not self.tokens:
+            raise ValueError("Empty rule expression")
+        node = self.expr()
+        if self.pos != len(self.tokens):
+            raise ValueError("Unexpected token {} in rule expression".format(self.tokens[self.pos]))
+        return node
+
+    def expr(self):
+        operands = [self.term()]
+        while self.peek() == 'or':
+            self.advance()
+            operands.append(self.term())
+        if len(operands) == 1:
+            return operands[0]
+        return Or(operands)
+
+    def term(self):
+        operands = [self.factor()]
+        while self.peek() == 'and':
+            self.advance()
+            operands.append(self.factor())
+        if len(operands) == 1:
+            return operands[0]
+        return And(operands)
+
+    def factor(self):
+        name = self.peek()
+        if name is None:
+            raise ValueError("Rule expression ended unexpectedly")
+        if name == 'not':
+            self.advance()
+            return Not(self.factor())
+        if name == '(':
+            self.advance()
+            node = self.expr()
+            if self.peek() != ')':
+                raise ValueError("Unbalanced parentheses in rule expression")
+            self.advance()
+            return node
+        if name in OPERATORS:
+            raise ValueError("Unexpected token {} in rule expression".format(self.tokens[self.pos]))
+        return Operand(self.advance())
+
+
+def compile_expression(tokens):
+    """
+    Compiles the list of tokens created by Rule._tokenize into a tree of Operand, Not, And and Or nodes.
+
+    The tree is built once, when the rule is defined. Evaluating it short-circuits, so a condition is only run if
+    its result can still change the outcome of the rule. The operands of each and/or are ordered by cost, so
+    configuration conditions run before conditions that need command output or getters.
+
+    resolve may return None for a condition that cannot be evaluated yet, for example because its command output
+    has not been collected. and/or then follow three-valued logic: False and None is False, True or None is True,
+    anything else involving None is None (undecided).
+
+    Example:
+    [Token(name='EXPR', value=<Match feature_vpc>), Token(name='and', value='&'), Token(name='(', value='('),
+    Token(name='EXPR', value=<Match global_loopguard>), Token(name='or', value='|'),
+    Token(name='EXPR', value=<Match global_no_loopguard>), Token(name=')', value=')')]
+    compiles to
+    (EXPR(feature_vpc) and (EXPR(global_loopguard) or EXPR(global_no_loopguard)))
+
+    :param tokens: list of tokens
+    :return: root node of the expression tree
+    """
+    tree = _Parser(tokens).parse()
+    logger.debug("compile_expression: tree: {}".format(tree))
+    return tree
@@ -0,0 +1,129 @@
+import logging
+import os
+import pickle
+import struct
+from collections import OrderedDict
+from collections.abc import Mapping
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'ROLLOUT-RULES\x01'
+_HEADER = struct.Struct('>Q')
+
+
+def compile_library(rule_objs, filename):
+    """
+    Serializes a dictionary of rule objects, such as the ones filled by rules.build_rules, into a rule library file.
+    The tokens, the compiled expression and the compiled regexes of every rule are stored, so loading a rule does
+    not construct or compile anything.
+
+    Each rule is pickled separately, behind an index of rule id: (offset, length), so a RuleLibrary only reads the
+    rules a task asks for. Conditions shared by several rules are stored once per rule.
+
+    Layout:
+    MAGIC | index length (8 bytes) | pickled index | pickled rule | pickled rule | ...
+
+    Example:
+    build_rules()
+    compile_library(default_vdc_rules, "default_vdc.rlib")
+    task = TestTask(devices, "Nxos", rules=["bgp", "ipint"], rule_objs=RuleLibrary("default_vdc.rlib"))
+
+    :param rule_objs: dictionary, rule id: Rule object
+    :param filename: str
+    :return: OrderedDict, rule id: (offset, length)
+    """
+    blobs = []
+    index = OrderedDict()
+    offset = 0
+    for rule_id, rule in rule_objs.items():
+        try:
+            blob = pickle.dumps(rule, protocol=pickle.HIGHEST_PROTOCOL)
+        except (pickle.PicklingError, AttributeError, TypeError) as e:
+            logger.critical("compile_library: rule {} cannot be serialized: {}".format(rule_id, e))
+            raise ValueError("rule {} cannot be serialized, GenericFunction and modify_variables functions must be "
+                             "defined at module level: {}".format(rule_id, e))
+        index[rule_id] = (offset, len(blob))
+        blobs.append(blob)
+        offset += len(blob)
+    header = pickle.dumps(index, protocol=pickle.HIGHEST_PROTOCOL)
+    with open(filename, 'wb') as f:
+        f.write(MAGIC)
+        f.write(_HEADER.pack(len(header)))
+        f.write(header)
+        for blob in blobs:
+            f.write(blob)
+    logger.debug("compile_library: wrote {} rules, {} bytes to {}".format(len(index), offset, filename))
+    return index
+
+
+class RuleLibrary(Mapping):
+    """
+    Read only dictionary of rule id: Rule object backed by a file written with compile_library.
+
+    Only the index is read when the library is opened. A rule is unpickled the first time it is looked up and kept
+    afterwards, so a task that loads 20 rules of a 5000 rule pack only pays for 20 rules. Iterating the keys does not
+    load any rule, iterating the values or the items loads all of them.
+
+    A RuleLibrary can be passed as rule_objs to any task.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        with open(filename, 'rb') as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError("{} is not a rule library".format(filename))
+            length, = _HEADER.unpack(f.read(_HEADER.size))
+            self._index = pickle.loads(f.read(length))
+            self._data_offset = len(MAGIC) + _HEADER.size + length
+        self._loaded = {}
+        logger.debug("RuleLibrary: {} rules in {}".format(len(self._index), filename))
+
+    def __getitem__(self, rule_id):
+        try:
+            return self._loaded[rule_id]
+        except KeyError:
+            pass
+        offset, length = self._index[rule_id]
+        with open(self.filename, 'rb') as f:
+            f.seek(self._data_offset + offset)
+            rule = pickle.loads(f.read(length))
+        self._loaded[rule_id] = rule
+        logger.debug("RuleLibrary: loaded rule {} - {}".format(rule_id, rule.exception))
+        return rule
+
+    def __iter__(self):
+        return iter(self._index)
+
+    def __len__(self):
+        return len(self._index)
+
+    def __contains__(self, rule_id):
+        return rule_id in self._index
+
+    def load(self, rule_ids):
+        """
+        Loads the rules with one open of the library file
+
+        :param rule_ids: list of rule ids
+        :return: OrderedDict, rule id: Rule object, in the order of the library
+        """
+        wanted = [rule_id for rule_id in self._index if rule_id in rule_ids]
+        missing = [rule_id for rule_id in wanted if rule_id not in self._loaded]
+        if missing:
+            with open(self.filename, 'rb') as f:
+                for rule_id in missing:
+                    offset, length = self._index[rule_id]
+                    f.seek(self._data_offset + offset)
+                    self._loaded[rule_id] = pickle.loads(f.read(length))
+        return OrderedDict((rule_id, self._loaded[rule_id]) for rule_id in wanted)
+
+    @property
+    def loaded(self):
+        """
+        :return: list of the ids of the rules loaded so far
+        """
+        return list(self._loaded)
+
+    @property
+    def size(self):
+        return os.path.getsize(self.filename)
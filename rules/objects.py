@@ -0,0 +1,199 @@
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class LineSource:
+    """
+    Loads the parse a device's LineRef objects were made from, the first time a template uses more of a line than
+    its text. The source holds the function loading the parse, not the parse, until a line is materialized.
+
+    Example:
+    source = LineSource(lambda: parse_cache.get(running_config))
+    source.line(450)
+    <IOSCfgLine # 450 'interface port-channel1'>
+    source.release()
+    """
+
+    def __init__(self, load):
+        """
+        :param load: function without arguments returning the parse, usually through the parse cache so the line
+        numbers are those of the evaluated parse
+        """
+        self._load = load
+        self._parse = None
+
+    @property
+    def loaded(self):
+        return self._parse is not None
+
+    @property
+    def parse(self):
+        if self._parse is None:
+            self._parse = self._load()
+            logger.debug("LineSource: loaded {}".format(type(self._parse).__name__))
+        return self._parse
+
+    def line(self, linenum):
+        """
+        :param linenum: int
+        :return: the line of the parse, IOSCfgLine or ConfigLine
+        """
+        parse = self.parse
+        if hasattr(parse, 'line'):
+            return parse.line(linenum)
+        return parse.ConfigObjs[linenum]
+
+    def release(self):
+        """
+        Drops the parse, it is loaded again if another line is materialized
+        """
+        self._parse = None
+
+
+class LineRef:
+    """
+    Compact, picklable reference to a line of a parsed configuration: its line number, its text and the line number
+    of its parent.
+
+    The results of the configuration conditions reference IOSCfgLine objects, and through them the whole parse of
+    the configuration. A LineRef only references its LineSource, so results converted with compact can be sent
+    between processes or kept after the parse is released. Attributes other than linenum, text, parent_linenum
+    and is_child, such as children or re_search_children, are read from the line of the parse, which is loaded
+    through the LineSource the first time they are used.
+
+    Example:
+    LineRef(450, 'interface port-channel1')
+    <LineRef # 450 'interface port-channel1'>
+    LineRef(451, '  vpc 1', 450).is_child
+    True
+    """
+    __slots__ = ('linenum', 'text', 'parent_linenum', '_source')
+
+    def __init__(self, linenum, text, parent_linenum=None, source=None):
+        """
+        :param linenum: int
+        :param text: str
+        :param parent_linenum: optional int, line number of the parent, None for a top level line
+        :param source: optional LineSource the line can be materialized from
+        """
+        self.linenum = linenum
+        self.text = text
+        self.parent_linenum = parent_linenum
+        self._source = source
+
+    @classmethod
+    def from_line(cls, line, source=None):
+        """
+        :param line: IOSCfgLine, ConfigLine or OverlayLine
+        :param source: optional LineSource
+        :return: LineRef
+        """
+        parent_linenum = line.parent.linenum if line.is_child else None
+        return cls(line.linenum, line.text, parent_linenum, source)
+
+    @property
+    def is_child(self):
+        return self.parent_linenum is not None
+
+    @property
+    def source(self):
+        return self._source
+
+    @source.setter
+    def source(self, source):
+        self._source = source
+
+    def materialize(self):
+        """
+        :return: the line of the parse this reference was made from
+        :raises AttributeError: if the reference has no LineSource
+        """
+        if self._source is None:
+            raise AttributeError("{} has no source to load the line from".format(self))
+        return self._source.line(self.linenum)
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return getattr(self.materialize(), name)
+
+    def __getstate__(self):
+        # the source is not sent with the reference, see bind
+        return self.linenum, self.text, self.parent_linenum
+
+    def __setstate__(self, state):
+        self.linenum, self.text, self.parent_linenum = state
+        self._source = None
+
+    def __deepcopy__(self, memo):
+        # templates deep copy the objects, the copies keep their source
+        return self
+
+    def __eq__(self, other):
+        if not isinstance(other, LineRef):
+            return NotImplemented
+        return self.linenum == other.linenum and self.text == other.text
+
+    def __hash__(self):
+        return hash((self.linenum, self.text))
+
+    def __lt__(self, other):
+        return self.linenum < other.linenum
+
+    def __repr__(self):
+        if self.is_child:
+            return "<LineRef # {} '{}' (parent is # {})>".format(self.linenum, self.text, self.parent_linenum)
+        return "<LineRef # {} '{}'>".format(self.linenum, self.text)
+
+
+def compact(results, refs=None, source=None):
+    """
+    Replaces the configuration lines in the results of conditions with LineRef objects, the structure of the
+    results, lists, tuples and dictionaries, is kept.
+
+    Example:
+    compact({'feature_vpc': [[<IOSCfgLine # 38 'feature vpc'>]]})
+    {'feature_vpc': [[<LineRef # 38 'feature vpc'>]]}
+
+    :param results: results of a condition or dict, condition name: results, such as Rule.objects
+    :param refs: optional dict, id of a line: LineRef, so a line found by several conditions is converted once
+    :param source: optional LineSource of the parse the results were found in
+    :return: results referencing LineRef objects
+    """
+    if refs is None:
+        refs = {}
+    if isinstance(results, list):
+        return [compact(r, refs, source) for r in results]
+    if isinstance(results, tuple):
+        return tuple(compact(r, refs, source) for r in results)
+    if isinstance(results, dict):
+        return {compact(k, refs, source): compact(v, refs, source) for k, v in results.items()}
+    if isinstance(results, LineRef):
+        return results
+    if hasattr(results, 'linenum') and hasattr(results, 'text'):
+        ref = refs.get(id(results))
+        if ref is None:
+            ref = refs[id(results)] = LineRef.from_line(results, source)
+        return ref
+    return results
+
+
+def bind(results, source):
+    """
+    Sets the LineSource of the LineRef objects of results, such as results received from a worker process
+
+    :param results: results converted with compact
+    :param source: LineSource
+    :return: results
+    """
+    if isinstance(results, (list, tuple)):
+        for r in results:
+            bind(r, source)
+    elif isinstance(results, dict):
+        for k, v in results.items():
+            bind(k, source)
+            bind(v, source)
+    elif isinstance(results, LineRef):
+        results.source = source
+    return results
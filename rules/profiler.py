@@ -0,0 +1,215 @@
+import csv
+import io
+import json
+import logging
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+CONDITION_FIELDS = ['device', 'rule', 'condition', 'condition_class', 'calls', 'total_time', 'max_time', 'matched']
+RULE_FIELDS = ['device', 'rule', 'calls', 'total_time', 'max_time']
+# rule and condition name of the entries timing the parse of the configurations
+PARSE = '<parse>'
+
+
+def count_objects(results):
+    """
+    Number of matched objects in the results of a condition.
+    Match and Count return a list of lists of IOSCfgLine objects, ChildMatch and ParentChildMatch a dictionary with
+    the parent objects, BlockMatch a list of lines.
+    """
+    if results is None:
+        return 0
+    if isinstance(results, dict):
+        if 'parents' in results:
+            return count_objects(results['parents'])
+        return len(results)
+    if isinstance(results, (list, tuple)):
+        if results and all(isinstance(r, (list, tuple)) for r in results):
+            return sum(len(r) for r in results)
+        return len(results)
+    return 1
+
+
+class DeviceRecorder:
+    """
+    Records the evaluation of rules and conditions for one device. Obtained with RuleProfiler.for_device and passed
+    to Rule.confirm_match.
+    """
+
+    def __init__(self, profiler, device):
+        self._profiler = profiler
+        self.device = device
+
+    def record_condition(self, rule, condition, condition_class, elapsed, matched):
+        self._profiler.record_condition(self.device, rule, condition, condition_class, elapsed, matched)
+
+    def record_rule(self, rule, elapsed):
+        self._profiler.record_rule(self.device, rule, elapsed)
+
+    def record_parse(self, elapsed):
+        self._profiler.record_parse(self.device, elapsed)
+
+
+class RuleProfiler:
+    """
+    Opt-in profiler for rule evaluation. Records wall time, call count and matched object count for each rule and
+    each condition per device.
+
+    Example:
+    task.enable_profiling()
+    task.run_all_rules()
+    print(task.profile.report(10))
+    task.profile.to_csv("profile.csv")
+    """
+
+    def __init__(self):
+        self._conditions = OrderedDict()
+        self._rules = OrderedDict()
+
+    def for_device(self, device):
+        return DeviceRecorder(self, device)
+
+    def record_condition(self, device, rule, condition, condition_class, elapsed, matched):
+        key = (device, rule, condition, condition_class)
+        entry = self._conditions.get(key)
+        if entry is None:
+            entry = self._conditions[key] = {'calls': 0, 'total_time': 0.0, 'max_time': 0.0, 'matched': 0}
+        entry['calls'] += 1
+        entry['total_time'] += elapsed
+        entry['max_time'] = max(entry['max_time'], elapsed)
+        entry['matched'] += matched
+
+    def record_rule(self, device, rule, elapsed):
+        key = (device, rule)
+        entry = self._rules.get(key)
+        if entry is None:
+            entry = self._rules[key] = {'calls': 0, 'total_time': 0.0, 'max_time': 0.0}
+        entry['calls'] += 1
+        entry['total_time'] += elapsed
+        entry['max_time'] = max(entry['max_time'], elapsed)
+
+    def record_parse(self, device, elapsed):
+        """
+        Records the parse of the configuration of the device as the PARSE rule and condition, so the time is not
+        counted in the first condition using the configuration
+        """
+        self.record_condition(device, PARSE, PARSE, 'parse', elapsed, 0)
+        self.record_rule(device, PARSE, elapsed)
+
+    def merge(self, other):
+        """
+        Adds the records of another profiler, such as the profiler of a worker process, to this one
+
+        :param other: RuleProfiler
+        """
+        for key, entry in other._conditions.items():
+            mine = self._conditions.get(key)
+            if mine is None:
+                self._conditions[key] = dict(entry)
+                continue
+            mine['calls'] += entry['calls']
+            mine['total_time'] += entry['total_time']
+            mine['max_time'] = max(mine['max_time'], entry['max_time'])
+            mine['matched'] += entry['matched']
+        for key, entry in other._rules.items():
+            mine = self._rules.get(key)
+            if mine is None:
+                self._rules[key] = dict(entry)
+                continue
+            mine['calls'] += entry['calls']
+            mine['total_time'] += entry['total_time']
+            mine['max_time'] = max(mine['max_time'], entry['max_time'])
+
+    def condition_records(self):
+        """
+        :return: list of dictionaries with the keys in CONDITION_FIELDS
+        """
+        return [dict(zip(CONDITION_FIELDS[:4], key), **entry) for key, entry in self._conditions.items()]
+
+    def rule_records(self):
+        """
+        :return: list of dictionaries with the keys in RULE_FIELDS
+        """
+        return [dict(zip(RULE_FIELDS[:2], key), **entry) for key, entry in self._rules.items()]
+
+    def top(self, n=10, level='condition'):
+        """
+        The n entries with the largest total time, summed across devices
+
+        :param n: int
+        :param level: str, 'rule', 'condition' or 'class'
+        :return: list of dictionaries sorted slowest first
+        """
+        if level == 'rule':
+            records, keys = self.rule_records(), ['rule']
+        elif level == 'condition':
+            records, keys = self.condition_records(), ['rule', 'condition', 'condition_class']
+        elif level == 'class':
+            records, keys = self.condition_records(), ['condition_class']
+        else:
+            raise ValueError("level must be one of 'rule', 'condition' or 'class'")
+        totals = OrderedDict()
+        for record in records:
+            key = tuple(record[k] for k in keys)
+            total = totals.get(key)
+            if total is None:
+                total = totals[key] = dict(zip(keys, key), calls=0, total_time=0.0, max_time=0.0, devices=set())
+                if 'matched' in record:
+                    total['matched'] = 0
+            total['calls'] += record['calls']
+            total['total_time'] += record['total_time']
+            total['max_time'] = max(total['max_time'], record['max_time'])
+            total['devices'].add(record['device'])
+            if 'matched' in record:
+                total['matched'] += record['matched']
+        for total in totals.values():
+            total['devices'] = len(total['devices'])
+        return sorted(totals.values(), key=lambda t: t['total_time'], reverse=True)[:n]
+
+    def report(self, n=10):
+        """
+        :return: str, the n slowest rules and conditions
+        """
+        lines = ["Top {} rules by total time".format(n)]
+        for entry in self.top(n, level='rule'):
+            lines.append("  {total_time:10.6f}s {calls:6d} calls  {rule}".format(**entry))
+        lines.append("Top {} conditions by total time".format(n))
+        for entry in self.top(n, level='condition'):
+            lines.append("  {total_time:10.6f}s {calls:6d} calls {matched:8d} objects  {rule} - {condition} "
+                         "({condition_class})".format(**entry))
+        return "\n".join(lines)
+
+    def to_json(self, filename=None):
+        """
+        :param filename: optional, file to write
+        :return: str
+        """
+        output = json.dumps({'rules': self.rule_records(), 'conditions': self.condition_records()}, indent=2,
+                            default=str)
+        if filename:
+            with open(filename, 'w') as f:
+                f.write(output)
+        return output
+
+    def to_csv(self, filename=None):
+        """
+        Writes the condition records as csv
+
+        :param filename: optional, file to write
+        :return: str
+        """
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=CONDITION_FIELDS)
+        writer.writeheader()
+        for record in self.condition_records():
+            writer.writerow(record)
+        output = buffer.getvalue()
+        if filename:
+            with open(filename, 'w', newline='') as f:
+                f.write(output)
+        return output
+
+    def clear(self):
+        self._conditions = OrderedDict()
+        self._rules = OrderedDict()
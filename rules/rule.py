@@ -1,10 +1,14 @@
 import logging
+import time
 import traceback
-from collections import namedtuple
+from collections import namedtuple, OrderedDict
 
 import sys
 
 from configuration.helpers import update_config
+from rules.expression import compile_expression, as_bool
+from rules.objects import compact
+from rules.profiler import count_objects
 from rules.condition.block_match import BlockMatch
 from rules.condition.child_match import ChildMatch
 from rules.condition.command_fsm_parser import CmdFsmParse
@@ -19,12 +23,21 @@ from rules.condition.command_parser import CmdParse
 
 logger = logging.getLogger(__name__)
 
+# defined at module level so the tokens of a rule can be pickled into a rule library
+Token = namedtuple('Token', ['name', 'value'])
+
+# tokens evaluated against the parsed configuration, generic functions receive the parse as well
+CONFIG_TOKENS = frozenset(['EXPR', 'CHILD', 'COUNT', 'BLOCK', 'PCMATCH', 'GENERIC'])
+
 
 class CannotCompleteAnalysisError(Exception):
     pass
 
 
 class Rule:
+    # When True, conditions that cannot change the outcome of the rule are not evaluated and their objects are not
+    # saved. Rules whose templates use the objects of every condition should set this to False.
+    short_circuit = True
 
     def __init__(self, title):
         # self._token_map = {'&':'and', '|':'or', '!':'not', '(':'LPAR', ')':'RPAR'}
@@ -34,6 +47,14 @@ class Rule:
         self._cli_commands = set([])
         self.need_get = False
         self._get_list = set([])
+        self.need_config = False
+
+    def __getstate__(self):
+        # the objects of the last evaluation reference the parsed configuration of a device, they are not part of
+        # the compiled rule
+        state = self.__dict__.copy()
+        state.pop('objects', None)
+        return state
 
     def set_confirm_match(self, *expr):
         """
@@ -118,8 +139,10 @@ class Rule:
         """
         logger.debug("set_confirm_match: expr {}, *expr {}".format(expr, *expr))
         self.tokens = self._tokenize(expr)
+        self.expression = compile_expression(self.tokens)
         self._check_for_cli()
         self._check_for_get()
+        self._check_for_config()
         logger.debug("set_confirm_match: tokens {}".format(self.tokens))
 
     def _tokenize(self, expr):
@@ -129,73 +152,94 @@ class Rule:
         :return: list of tokens
         """
         token_map = {'&': 'and', '|': 'or', '!': 'not', '(': '(', ')': ')'}
-        _Token = namedtuple('Token', ['name', 'value'])
         logger.debug("_tokenize: expr {} {}".format(expr, type(expr)))
         tokens = []
         for i in expr:
             logger.debug("_tokenize: i: {}".format(i))
             if isinstance(i, Match):
-                tokens.append(_Token(token_map.get(i, 'EXPR'), i))
+                tokens.append(Token(token_map.get(i, 'EXPR'), i))
             elif isinstance(i, ChildMatch):
-                tokens.append(_Token(token_map.get(i, 'CHILD'), i))
+                tokens.append(Token(token_map.get(i, 'CHILD'), i))
             elif isinstance(i, Count):
-                tokens.append(_Token(token_map.get(i, 'COUNT'), i))
+                tokens.append(Token(token_map.get(i, 'COUNT'), i))
             elif isinstance(i, GenericFunction):
-                tokens.append(_Token(token_map.get(i, 'GENERIC'), i))
+                tokens.append(Token(token_map.get(i, 'GENERIC'), i))
             elif isinstance(i, CompareOS):
-                tokens.append(_Token(token_map.get(i, 'CMPOS'), i))
+                tokens.append(Token(token_map.get(i, 'CMPOS'), i))
             elif isinstance(i, BlockMatch):
-                tokens.append(_Token(token_map.get(i, 'BLOCK'), i))
+                tokens.append(Token(token_map.get(i, 'BLOCK'), i))
             elif isinstance(i, CmdParse):
-                tokens.append(_Token(token_map.get(i, 'CMDP'), i))
+                tokens.append(Token(token_map.get(i, 'CMDP'), i))
             elif isinstance(i, CmdFsmParse):
-                tokens.append(_Token(token_map.get(i, 'CMDPFSM'), i))
+                tokens.append(Token(token_map.get(i, 'CMDPFSM'), i))
             elif isinstance(i, NapalmGet):
-                tokens.append(_Token(token_map.get(i, 'NAPGET'), i))
+                tokens.append(Token(token_map.get(i, 'NAPGET'), i))
             elif isinstance(i, ParentChildMatch):
-                tokens.append(_Token(token_map.get(i, 'PCMATCH'), i))
+                tokens.append(Token(token_map.get(i, 'PCMATCH'), i))
             elif i in ''.join(token_map):
-                tokens.append(_Token(token_map.get(i), i))
+                tokens.append(Token(token_map.get(i), i))
             else:
                 logger.critical("Error Tokenizing: {}".format(expr))
                 raise ValueError("token {} is not recognized".format(i))
         logger.debug("_tokenize: tokens: {}".format(tokens))
         return tokens
 
-    def _match(self, parse, cli_commands=None, hard_dict=None, get_methods_output=None):
-        line = ''
+    def _match(self, parse, cli_commands=None, hard_dict=None, get_methods_output=None, cache=None, partial=False,
+               profiler=None):
+        def resolve(token):
+            if profiler is None:
+                return _resolve(token)
+            start = time.perf_counter()
+            result = _resolve(token)
+            name = getattr(token.value, 'name', str(token.value))
+            profiler.record_condition(self.exception, name, token.value.__class__.__name__,
+                                      time.perf_counter() - start, count_objects(self.objects.get(name)))
+            return result
+
+        def _resolve(token):
+            if partial and self._missing_data(token, cli_commands=cli_commands,
+                                              get_methods_output=get_methods_output):
+                logger.debug("_match: token {}: output not collected, undecided".format(token.name))
+                return None
+            if token.name == 'EXPR':
+                result = self._parse(token, parse, cache=cache)
+            elif token.name == 'CHILD':
+                result = self._parse(token, parse, cache=cache)
+            elif token.name == 'COUNT':
+                result = self._parse(token, parse, cache=cache)
+            elif token.name == 'BLOCK':
+                result = self._parse(token, parse, cache=cache)
+            elif token.name == 'GENERIC':
+                result = self._generic(token, parse, cli_commands=cli_commands)
+            elif token.name == 'CMPOS':
+                result = self._compare_os(token, hard_dict=hard_dict)
+            elif token.name == 'CMDP':
+                result = self._cmd_parse(token, cli_commands=cli_commands)
+            elif token.name == 'CMDPFSM':
+                result = self._cmd_parse(token, cli_commands=cli_commands)
+            elif token.name == 'NAPGET':
+                result = self._napalm_get(token, get_methods_output=get_methods_output)
+            elif token.name == 'PCMATCH':
+                result = self._parse(token, parse, cache=cache)
+            else:
+                raise ValueError("token {} is not recognized".format(token))
+            logger.debug("_match: token {}: result {}".format(token.name, result))
+            return as_bool(result)
+
         try:
-            for token in self.tokens:
-                if token.name == 'EXPR':
-                    result = self._parse(token, parse)
-                elif token.name == 'CHILD':
-                    result = self._parse(token, parse)
-                elif token.name == 'COUNT':
-                    result = self._parse(token, parse)
-                elif token.name == 'BLOCK':
-                    result = self._parse(token, parse)
-                elif token.name == 'GENERIC':
-                    result = self._generic(token, parse, cli_commands=cli_commands)
-                elif token.name == 'CMPOS':
-                    result = self._compare_os(token, hard_dict=hard_dict)
-                elif token.name == 'CMDP':
-                    result = self._cmd_parse(token, cli_commands=cli_commands)
-                elif token.name == 'CMDPFSM':
-                    result = self._cmd_parse(token, cli_commands=cli_commands)
-                elif token.name == 'NAPGET':
-                    result = self._napalm_get(token, get_methods_output=get_methods_output)
-                elif token.name == 'PCMATCH':
-                    result = self._parse(token, parse)
-                else:
-                    result = token.name
-                line = '{} {}'.format(line, result)
-            logger.debug("_match: line {}".format(line))
-            return eval(line)
+            if not self.short_circuit:
+                results = {id(token): resolve(token) for token in self.expression.operands()}
+                result = self.expression.evaluate(lambda token: results[id(token)])
+            else:
+                result = self.expression.evaluate(resolve)
+            logger.debug("_match: expression {}: result {}".format(self.expression, result))
+            return result
         except CannotCompleteAnalysisError as err:
             logger.critical(err)
             raise
 
-    def confirm_match(self, parse, cli_commands=None, hard_dict=None, get_methods_output=None, modify_config=False):
+    def confirm_match(self, parse, cli_commands=None, hard_dict=None, get_methods_output=None, modify_config=False,
+                      cache=None, partial=False, profiler=None):
         """
         Takes the config of the device, splits it into lines, creates a CiscoConfParse object
         and determines if the configuration matches the rule.
@@ -273,20 +317,84 @@ class Rule:
         of the parent object are searched for a match to the child regex and the tuple of the regex capture groups is returned.
 
         :param showrun: str, configuration of the device
+        :param cache: optional ConditionCache shared by the rules evaluated against the same device, configuration
+        conditions found in the cache are not run again
+        :param partial: bool, if True, conditions whose command output or getter output is missing from cli_commands
+        or get_methods_output are treated as undecided instead of raising. The result is None if the rule cannot be
+        decided without them
+        :param profiler: optional DeviceRecorder, see RuleProfiler.for_device
         :return: Bool
         """
         self.objects = {}
-        result = self._match(parse, cli_commands=cli_commands, hard_dict=hard_dict, get_methods_output=get_methods_output)
+        start = time.perf_counter()
+        result = self._match(parse, cli_commands=cli_commands, hard_dict=hard_dict, get_methods_output=get_methods_output,
+                             cache=cache, partial=partial, profiler=profiler)
+        if profiler is not None:
+            profiler.record_rule(self.exception, time.perf_counter() - start)
         pcfg = parse
         if modify_config and result:
-            template = self.generate_config()
-            parse = update_config(template, parse)
-            pcfg = parse
+            template = self.generate_config(self.objects)
+            if template:
+                parse = update_config(template, parse)
+                pcfg = parse
         return result, self.objects, pcfg
 
-    def _parse(self, token, parse):
+    def compact_objects(self, source=None, refs=None):
+        """
+        Replaces the configuration lines in self.objects with LineRef objects, so the rule does not keep the parse of
+        the last evaluated device alive, see rules.objects
+
+        :param source: optional LineSource of the parse the rule was evaluated against
+        :param refs: optional dict shared by the rules evaluated against the same parse, see compact
+        :return: dict, self.objects
+        """
+        self.objects = compact(getattr(self, 'objects', {}), refs, source)
+        return self.objects
+
+    def confirm_match_many(self, parses, cli_commands=None, hard_dict=None, get_methods_output=None,
+                           modify_config=False, caches=None, partial=False, profiler=None):
+        """
+        Evaluates the rule against many devices in one batch. The expression tree and the compiled regexes of the
+        conditions are reused for every device.
+
+        Example:
+        results = rule.confirm_match_many({'switch1': parse1, 'switch2': parse2})
+        {'switch1': (True, {'feature_vpc': [[<IOSCfgLine # 38 'feature vpc'>]]}, parse1),
+         'switch2': (False, {'feature_vpc': [[]]}, parse2)}
+
+        :param parses: dict, device: parsed configuration
+        :param cli_commands: optional dict, device: dictionary of command outputs
+        :param hard_dict: optional dict, device: device facts
+        :param get_methods_output: optional dict, device: dictionary of get method outputs
+        :param modify_config: bool, see confirm_match
+        :param caches: optional dict, device: ConditionCache
+        :param partial: bool, see confirm_match
+        :param profiler: optional RuleProfiler
+        :return: dict, device: (result, objects, parse) as returned by confirm_match
+        """
+        cli_commands = cli_commands or {}
+        hard_dict = hard_dict or {}
+        get_methods_output = get_methods_output or {}
+        caches = caches or {}
+        answers = OrderedDict()
+        for device, parse in parses.items():
+            logger.debug("confirm_match_many: rule: {}, device: {}".format(self.exception, device))
+            answers[device] = self.confirm_match(parse,
+                                                 cli_commands=cli_commands.get(device),
+                                                 hard_dict=hard_dict.get(device),
+                                                 get_methods_output=get_methods_output.get(device),
+                                                 modify_config=modify_config,
+                                                 cache=caches.get(device),
+                                                 partial=partial,
+                                                 profiler=profiler.for_device(device) if profiler else None)
+        return answers
+
+    def _parse(self, token, parse, cache=None):
         logger.debug("_confparsed_config: rule: {}".format(self.exception))
-        result, results = token.value.run(parse)
+        if cache is not None:
+            result, results = cache.run(token.value, parse)
+        else:
+            result, results = token.value.run(parse)
         self.objects[token.value.name] = results
         logger.debug("_confparsed_config: self.ojects: {}".format(self.objects))
         logger.debug("_confparsed_config: final result {}".format(result))
@@ -314,6 +422,15 @@ class Rule:
             raise
         return result
 
+    def generate_config(self, objects):
+        """
+        Rules without a configuration template do not modify the configuration, see TemplateRule
+
+        :param objects: dict, results of the conditions
+        :return: None
+        """
+        return None
+
     @property
     def cli_commands(self):
         return self._cli_commands
@@ -370,7 +487,7 @@ class Rule:
             cmds = set([cmds])
         logger.debug("append_get: cmds: {}".format(cmds))
         self.need_get = True
-        self._get_list = self._cli_commands | cmds
+        self._get_list = self._get_list | cmds
 
     def _compare_os(self, token, hard_dict=None):
         """
@@ -416,6 +533,18 @@ class Rule:
         logger.debug("_cmd_parse: final result {}".format(result))
         return result
 
+    def _missing_data(self, token, cli_commands=None, get_methods_output=None):
+        """
+        Returns True if the command output or getter output needed by the token has not been collected
+        """
+        commands = getattr(token.value, 'command_list', None)
+        if commands and (cli_commands is None or any(cmd not in cli_commands for cmd in commands)):
+            return True
+        get_list = getattr(token.value, 'get_list', None)
+        if get_list and (get_methods_output is None or any(get not in get_methods_output for get in get_list)):
+            return True
+        return False
+
     def _check_for_cli(self):
         for token in self.tokens:
             logger.debug("checking {} for command_list".format(token))
@@ -424,6 +553,10 @@ class Rule:
                 self.append_cli_commands(set(token.value.command_list))
                 logger.debug("new command list is {}".format(self.cli_commands))
 
+    def _check_for_config(self):
+        self.need_config = any(token.name in CONFIG_TOKENS for token in self.tokens)
+        logger.debug("rule {} needs the configuration: {}".format(self.exception, self.need_config))
+
     def _napalm_get(self, token, get_methods_output=None):
         logger.debug("_napalm_get: rule: {}, get_list: {}".format(self.exception, token.value.get_list))
         if get_methods_output is None:
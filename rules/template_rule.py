@@ -9,6 +9,9 @@ logger = logging.getLogger(__name__)
 
 
 class TemplateRule(Rule):
+    # templates may reference the objects of any condition, so every condition is evaluated
+    short_circuit = False
+
     def set_config_template(self, template=None, modify_variables=None):
         """
 
@@ -17,15 +20,32 @@ class TemplateRule(Rule):
         :return:
         """
         self._template = template
+        self._compiled_template = None
         self._modify_variables_func = modify_variables
 
     @property
     def template(self):
         return self._template
 
+    @property
+    def compiled_template(self):
+        """
+        The jinja2 Template, compiled the first time the rule generates a configuration and reused afterwards
+        """
+        compiled = getattr(self, '_compiled_template', None)
+        if compiled is None:
+            compiled = self._compiled_template = Template(self.template)
+        return compiled
+
+    def __getstate__(self):
+        # jinja2 templates cannot be pickled, a rule loaded from a rule library compiles its template on first use
+        state = super().__getstate__()
+        state.pop('_compiled_template', None)
+        return state
+
     def generate_config(self, objects):
         logger.debug("generate_config: received objects: {}".format(objects))
-        t = Template(self.template)
+        t = self.compiled_template
         local_objects = deepcopy(objects)
         if self._modify_variables_func is not None:
             local_objects = self._modify_variables_func(local_objects)
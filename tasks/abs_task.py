@@ -2,10 +2,17 @@ import abc
 import importlib
 import inspect
 import logging
+import threading
 from collections import OrderedDict
 
 from napalm.base import ModuleImportError
 
+from configuration.parse_cache import parse_cache
+from device.session_pool import session_pool
+from rules.compiler import ScanPlan, compile_rule_set
+from rules.library import RuleLibrary
+from rules.profiler import RuleProfiler
+
 logger = logging.getLogger(__name__)
 
 
@@ -33,9 +40,14 @@ class abs_task(metaclass=abc.ABCMeta):
         self.username = username
         self.password = password
         self.timeout = timeout
+        self._skip_info = False
         self._skip_config = False
+        self._need_config = True
         self._skip_facts = False
         self._skip_commands = False
+        self._skip_methods = False
+        self._lazy_collection = False
+        self._incremental = False
         self.optional_args = optional_args
         self._running_config = {}
         self._device_facts = {}
@@ -44,6 +56,23 @@ class abs_task(metaclass=abc.ABCMeta):
         self._cli_commands = {}
         self._get_methods = {}
         self._confparsed_config = {}
+        self._line_sources = {}
+        self._planned = {}
+        self._previous = {}
+        self._parse_cache = parse_cache
+        self._session_pool = session_pool
+        self._config_tree = False
+        self._config_spool = None
+        self._scan_plan = ScanPlan([])
+        self._collection_workers = None
+        self._site_limit = None
+        self._device_sites = None
+        self._collection_errors = {}
+        self._async_collection = False
+        self._pipelined_cli = False
+        # planning the collection evaluates the shared rule objects and parse cache, one device at a time
+        self._plan_lock = threading.Lock()
+        self._profiler = None
         self._matches = {}
         self._objects = {}
 
@@ -72,6 +101,138 @@ class abs_task(metaclass=abc.ABCMeta):
     def get_methods_results(self):
         return self._get_methods
 
+    @property
+    def profile(self):
+        """
+        RuleProfiler with the timings of the rule evaluations, None unless enable_profiling was called
+        """
+        return self._profiler
+
+    def enable_profiling(self):
+        """
+        Records wall time, call count and matched object count for each rule and condition, per device, during the
+        following runs. Results are available in self.profile. The configuration of each device is parsed before
+        its rules are timed, also when no condition uses it, and the parse is recorded as its own <parse> entry.
+
+        :return: RuleProfiler
+        """
+        self._profiler = RuleProfiler()
+        return self._profiler
+
+    def disable_profiling(self):
+        self._profiler = None
+
+    @property
+    def parse_cache(self):
+        """
+        ParseCache the configurations are parsed through, the process wide cache by default. None parses every
+        configuration again.
+        """
+        return self._parse_cache
+
+    @parse_cache.setter
+    def parse_cache(self, cache):
+        self._parse_cache = cache
+
+    @property
+    def session_pool(self):
+        """
+        SessionPool the device sessions are borrowed from, the process wide pool by default, so tasks run against
+        the same devices reuse the sessions. None opens and closes a session for every device context.
+        """
+        return self._session_pool
+
+    @session_pool.setter
+    def session_pool(self, pool):
+        self._session_pool = pool
+
+    @property
+    def pipelined_cli(self):
+        """
+        If True, the cli commands of each device are pipelined on its channel by drivers supporting it, see
+        Device.run_cli_command_list
+        """
+        return self._pipelined_cli
+
+    @pipelined_cli.setter
+    def pipelined_cli(self, value):
+        self._pipelined_cli = bool(value)
+
+    @property
+    def use_config_tree(self):
+        """
+        If True, configurations are parsed into the compact, read only ConfigTree instead of CiscoConfParse for
+        evaluating the rules. Runs with modify_config modify a ConfigOverlay of the parse.
+        """
+        return self._config_tree
+
+    @use_config_tree.setter
+    def use_config_tree(self, value):
+        self._config_tree = bool(value)
+
+    @property
+    def config_spool(self):
+        """
+        Directory the configurations received from the devices are written to. When set, each configuration is
+        kept as a MappedConfig of its spool file instead of a str, see configuration.ingest. None keeps the str.
+        """
+        return self._config_spool
+
+    @config_spool.setter
+    def config_spool(self, directory):
+        self._config_spool = directory
+
+    @property
+    def collection_workers(self):
+        """
+        Number of devices the information is collected from at the same time, the global cap of the concurrent
+        collection. None or 1 collects from one device after the other.
+        """
+        return self._collection_workers
+
+    @collection_workers.setter
+    def collection_workers(self, workers):
+        self._collection_workers = workers
+
+    @property
+    def site_limit(self):
+        """
+        Maximum number of devices of the same site collected from at the same time, None for no limit. The site of
+        each device is given by device_sites.
+        """
+        return self._site_limit
+
+    @site_limit.setter
+    def site_limit(self, limit):
+        self._site_limit = limit
+
+    @property
+    def device_sites(self):
+        """
+        dict, device: site, or function called with the device name returning its site. Devices without a site are
+        not limited by site_limit.
+        """
+        return self._device_sites
+
+    @device_sites.setter
+    def device_sites(self, sites):
+        self._device_sites = sites
+
+    def _device_site(self, device):
+        if self._device_sites is None:
+            return None
+        if callable(self._device_sites):
+            return self._device_sites(device)
+        return self._device_sites.get(device)
+
+    @property
+    def collection_errors(self):
+        """
+        dict, device: exception raised while collecting its information during the last concurrent collection. The
+        rules are not evaluated for these devices.
+        """
+        return self._collection_errors
+
     def get_device_matches(self, device):
         return self._matches[device]
 
@@ -82,7 +243,7 @@ class abs_task(metaclass=abc.ABCMeta):
         """
 
         :param rules: list of rule ids to load
-        :param rule_objs: is a dictionary containing rule objects
+        :param rule_objs: is a dictionary containing rule objects or a RuleLibrary
         The rule ids loaded is an intersection of the all_rules dictionary and the device_nuggets list
         :return: None
 
@@ -93,9 +254,14 @@ class abs_task(metaclass=abc.ABCMeta):
         if not isinstance(rules, list):
             rules = [rules]
         self.logger.debug("Loading Rules: {}".format(rules))
-        self.loaded_rules = OrderedDict(
-            [(rule, rule_obj) for rule, rule_obj in rule_objs.items() if rule in rules])
+        if isinstance(rule_objs, RuleLibrary):
+            # only the requested rules are read from the library file
+            self.loaded_rules = rule_objs.load(rules)
+        else:
+            self.loaded_rules = OrderedDict(
+                [(rule, rule_obj) for rule, rule_obj in rule_objs.items() if rule in rules])
         self.logger.debug("_load_device_rules: self.loaded_rules: {}".format(self.loaded_rules))
+        self._scan_plan = compile_rule_set(self.loaded_rules)
 
     @abc.abstractmethod
     def set_device_rules(self, rules, rule_objs):
@@ -109,6 +275,19 @@ class abs_task(metaclass=abc.ABCMeta):
             if rule.need_cli:
                 self._cli_command_list = self._cli_command_list | rule.cli_commands
 
+    def _determine_config_need(self):
+        """
+        Sets self._need_config, False when no loaded rule has a condition evaluated against the configuration, such as
+        rule sets made only of CmdParse, CmdFsmParse, NapalmGet and CompareOS conditions
+        """
+        # rules compiled before need_config existed are assumed to need the configuration
+        self._need_config = any(getattr(rule, 'need_config', True) for rule in self.loaded_rules.values())
+        self.logger.debug("_determine_config_need: {}".format(self._need_config))
+
+    @property
+    def need_config(self):
+        return self._need_config
+
     def _determine_get_method_list(self):
         self.logger.debug("_determine_get_method_list")
         self.logger.debug("original get_method_list: {}".format(self._get_method_list))
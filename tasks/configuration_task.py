@@ -92,7 +92,7 @@ class ConfigTask(TemplateTask):
     def _push_config(self, device_name, rule):
         self.logger.debug("Loading {} candidate ...".format(rule.deploy))
         with Device(device_name, self.device_class, self.username, self.password, timeout=self.timeout,
-                    optional_args=self.optional_args) as device:
+                    optional_args=self.optional_args, pool=self._session_pool) as device:
             device.get_config()
             self.running_config[device_name] = device.running_config
             try:
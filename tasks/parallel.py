@@ -0,0 +1,70 @@
+import logging
+
+from configuration.parse_cache import ParseCache
+from rules.objects import compact
+
+logger = logging.getLogger(__name__)
+
+# task of the worker process, created once per worker by init_worker
+_task = None
+_profile = False
+
+
+def init_worker(task_class, rules, options):
+    """
+    Initializer of the worker processes of TestTask.run_all_rules with processes. The rules are received once per
+    worker, not once per device.
+
+    :param task_class: TestTask or a subclass, the class of the task running the pool
+    :param rules: dict, rule id: rule object, the loaded rules of the task
+    :param options: dict, settings of the task, see TestTask._worker_options
+    """
+    global _task, _profile
+    _task = task_class([], rules=list(rules), rule_objs=rules)
+    _task.use_config_tree = options['config_tree']
+    if options['parse_cache'] is None:
+        _task.parse_cache = None
+    else:
+        max_lines, directory = options['parse_cache']
+        _task.parse_cache = ParseCache(max_lines=max_lines, directory=directory)
+    _profile = options['profile']
+    logger.debug("init_worker: {} rules".format(len(rules)))
+
+
+def evaluate_device(job):
+    """
+    Evaluates the rules for one device in a worker process
+
+    :param job: tuple, (device, configuration, cli command outputs, facts, get method outputs, lazy_collection,
+    modify_config)
+    :return: dict with the keys
+        device: str
+        matches: dict, rule id: result
+        objects: results of the conditions, with LineRef objects instead of configuration lines, see compact
+        config: list of the lines of the modified configuration with modify_config, else None
+        profile: RuleProfiler of the evaluation if the task is profiled, else None
+    """
+    device, config, cli_commands, facts, methods, lazy_collection, modify_config = job
+    task = _task
+    task.device_list = [device]
+    task._running_config[device] = config
+    task._cli_commands[device] = cli_commands
+    task._device_facts[device] = facts
+    task._get_methods[device] = methods
+    task._skip_info = True
+    task._lazy_collection = lazy_collection
+    profiler = task.enable_profiling() if _profile else None
+    try:
+        task.run_all_device_rules(device, modify_config=modify_config)
+        parse = task._confparsed_config[device]
+        return {'device': device,
+                'matches': task.matches[device],
+                'objects': compact(task._objects[device]),
+                'config': list(parse.ioscfg) if modify_config else None,
+                'profile': profiler}
+    finally:
+        # the worker evaluates many devices, nothing of this one is kept
+        for state in (task._running_config, task._cli_commands, task._device_facts, task._get_methods,
+                      task._confparsed_config, task._matches, task._objects, task._line_sources):
+            state.pop(device, None)
+        task.disable_profiling()
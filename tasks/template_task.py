@@ -25,6 +25,10 @@ class TemplateTask(TestTask):
 
     @property
     def objects(self):
+        """
+        dict, device: objects of the conditions of every rule. Configuration lines are held as LineRef objects, which
+        load the parse of the device only if a template uses more of a line than its text, see rules.objects
+        """
         return self._objects
 
     @property
@@ -43,6 +47,9 @@ class TemplateTask(TestTask):
         """
         yield from super().run_rule(device, nugget=None, modify_config=modify_config, save_objects=save_objects)
 
+    def run_rule_major(self, modify_config=False, save_objects=True):
+        return super().run_rule_major(modify_config=modify_config, save_objects=save_objects)
+
     def _determine_templates(self):
         for name, rule in self.loaded_rules.items():
             if hasattr(rule, 'template'):
@@ -77,11 +84,15 @@ class TemplateTask(TestTask):
                     self._generated_templates[device][rule] = "!*** {} ***\n{}\nTemplate: {}\n\n".format(rule_obj.exception, "**ANALYSIS FAILED**, Configuration Must Be Generated Manually", rule_obj.template)
                 else:
                     continue
+        source = self._line_sources.get(device)
+        if source is not None:
+            # the parse loaded for materializing the lines is not kept once the templates are rendered
+            source.release()
         #self._generated_templates[device] = self.config
         logger.debug("generate_all_configs for device {}: self.config: {}".format(device, self._generated_templates[device]))
 
     def generate_all_configs(self):
-        for device in self.device_list:
+        for device in self._evaluated_devices():
             self.generate_all_device_configs(device)
 
 
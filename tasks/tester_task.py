@@ -1,9 +1,25 @@
+import asyncio
 import logging
+import pickle
+import threading
+import time
 from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from itertools import zip_longest
 
 from ciscoconfparse import CiscoConfParse
 
+from device.async_device import AsyncDevice
 from device.device import Device
+from configuration.config_tree import ConfigTree
+from configuration.delta import ConfigDelta
+from configuration.ingest import MappedConfig
+from configuration.overlay import ConfigOverlay
+from rules.compiler import ScannedConfig
+from rules.condition.cache import ConditionCache
+from rules.condition.regex_registry import registry
+from rules.objects import LineSource, bind, compact
+from tasks import parallel
 from tasks.abs_task import abs_task
 
 logger = logging.getLogger(__name__)
@@ -33,6 +49,7 @@ class TestTask(abs_task):
         self._load_device_rules(rules, rule_objs=rule_objs)
         self._determine_cli_command_list()
         self._determine_get_method_list()
+        self._determine_config_need()
 
     def run_rule(self, device, nugget=None, modify_config=False, save_objects=False):
         """
@@ -46,30 +63,49 @@ class TestTask(abs_task):
         else:
             loaded_rules = self.loaded_rules
         self.logger.debug("Running loaded rules: {}".format(loaded_rules))
-        self._confparsed_config[device] = CiscoConfParse(self.running_config[device].splitlines())
+        start = time.perf_counter()
+        planned = self._planned.pop(device, None)
+        if planned is not None and not modify_config:
+            # reuse the parse and condition results from planning the collection of cli output and getters
+            self._confparsed_config[device], cache = planned
+        else:
+            self._confparsed_config[device], cache = self._prepare_device(device, modify_config=modify_config)
+        self._record_parse(device, self._confparsed_config[device], start)
         self.logger.debug("_confparsed_config: {}".format(self._confparsed_config))
         self._matches[device] = {}
         self._objects[device] = {}
+        source = None
+        # a line found by several rules is converted to a single LineRef
+        refs = {}
+        if not modify_config:
+            source = self._line_sources[device] = LineSource(self._config_loader(device))
+        profiler = self._profiler.for_device(device) if self._profiler is not None else None
         for rule, rule_obj in loaded_rules.items():
             logger.debug("Running rule {} - {} for device {}".format(rule, rule_obj, device))
             if not save_objects:
                 if rule_obj.need_cli:
                     logger.debug(
                         "Don't save objects. Need cli output to run rule: {}".format(self._cli_commands[device]))
-                    self._matches[device][rule], _, pcfg = rule_obj.confirm_match(self._confparsed_config[device],
+                    self._matches[device][rule], obj, pcfg = rule_obj.confirm_match(self._confparsed_config[device],
                                                                                   cli_commands=self._cli_commands[
                                                                                       device],
                                                                                   hard_dict=self.device_facts[device],
                                                                                   get_methods_output=
                                                                                   self.get_methods_results[device],
-                                                                                  modify_config=modify_config)
+                                                                                  modify_config=modify_config,
+                                                                                  cache=cache,
+                                                                                  partial=self._lazy_collection,
+                                                                                  profiler=profiler)
                 else:
                     logger.debug("Don't save objects. Does not need cli output to run rule.")
-                    self._matches[device][rule], _, pcfg = rule_obj.confirm_match(self._confparsed_config[device],
+                    self._matches[device][rule], obj, pcfg = rule_obj.confirm_match(self._confparsed_config[device],
                                                                                   hard_dict=self.device_facts[device],
                                                                                   get_methods_output=
                                                                                   self.get_methods_results[device],
-                                                                                  modify_config=modify_config)
+                                                                                  modify_config=modify_config,
+                                                                                  cache=cache,
+                                                                                  partial=self._lazy_collection,
+                                                                                  profiler=profiler)
             else:
                 if rule_obj.need_cli:
                     logger.debug(
@@ -79,24 +115,254 @@ class TestTask(abs_task):
                         cli_commands=self._cli_commands[device],
                         hard_dict=self.device_facts[device],
                         get_methods_output=self.get_methods_results[device],
-                        modify_config=modify_config)
+                        modify_config=modify_config,
+                        cache=cache,
+                        partial=self._lazy_collection,
+                        profiler=profiler)
                 else:
                     logger.debug("Save objects. Does not need cli output to run rule.")
                     self.matches[device][rule], obj, pcfg = rule_obj.confirm_match(
                         self._confparsed_config[device],
                         hard_dict=self.device_facts[device],
                         get_methods_output=self.get_methods_results[device],
-                        modify_config=modify_config)
+                        modify_config=modify_config,
+                        cache=cache,
+                        partial=self._lazy_collection,
+                        profiler=profiler)
+            if not modify_config:
+                # the objects reference the lines through the LineSource instead of keeping the parse alive
+                obj = rule_obj.compact_objects(source, refs=refs)
+            if save_objects:
                 self._objects[device].update(obj)
+            if self._matches[device][rule] is None:
+                logger.critical("Rule {} for device {} could not be decided with the collected output".format(
+                    rule, device))
+                self._matches[device][rule] = "unknown"
             if modify_config:
+                cache = self._modified(self._confparsed_config[device], pcfg, cache)
                 self._confparsed_config[device] = pcfg
             yield self.get_rule_name(rule), self.matches[device][rule]
+        if not modify_config:
+            self._remember(device, self._confparsed_config[device], cache)
+            self._release_parse(device)
+
+    def run_rule_major(self, modify_config=False, save_objects=False):
+        """
+        Analyzes the loaded rules one rule at a time across every device, instead of one device at a time. Each rule
+        is evaluated against all of the parsed configurations in a batch with Rule.confirm_match_many.
+
+        :param modify_config: bool
+        :param save_objects: bool
+        :return: self.matches
+        """
+        parses = OrderedDict()
+        caches = {}
+        sources = {}
+        refs = {}
+        for device in self._evaluated_devices():
+            start = time.perf_counter()
+            planned = self._planned.pop(device, None)
+            if planned is not None and not modify_config:
+                parses[device], caches[device] = planned
+            else:
+                parses[device], caches[device] = self._prepare_device(device, modify_config=modify_config)
+            self._record_parse(device, parses[device], start)
+            self._matches[device] = {}
+            self._objects[device] = {}
+            if not modify_config:
+                sources[device] = self._line_sources[device] = LineSource(self._config_loader(device))
+                refs[device] = {}
+        for rule, rule_obj in self.loaded_rules.items():
+            logger.debug("Running rule {} - {} for devices {}".format(rule, rule_obj, list(parses)))
+            cli_commands = None
+            if rule_obj.need_cli:
+                cli_commands = self._cli_commands
+            answers = rule_obj.confirm_match_many(parses, cli_commands=cli_commands, hard_dict=self.device_facts,
+                                                  get_methods_output=self.get_methods_results,
+                                                  modify_config=modify_config, caches=caches,
+                                                  partial=self._lazy_collection,
+                                                  profiler=self._profiler)
+            for device, (result, obj, pcfg) in answers.items():
+                if result is None:
+                    logger.critical("Rule {} for device {} could not be decided with the collected output".format(
+                        rule, device))
+                    result = "unknown"
+                self._matches[device][rule] = result
+                if not modify_config:
+                    obj = compact(obj, refs[device], sources[device])
+                if save_objects:
+                    self._objects[device].update(obj)
+                if modify_config:
+                    caches[device] = self._modified(parses[device], pcfg, caches[device])
+                    parses[device] = pcfg
+            if not modify_config:
+                # the rule still holds the objects of the last device
+                rule_obj.compact_objects()
+        self._confparsed_config.update(parses)
+        if not modify_config:
+            for device, parse in parses.items():
+                self._remember(device, parse, caches[device])
+                self._release_parse(device)
+        self.logger.debug("run_rule_major: self.matches: {}".format(self.matches))
+        return self.matches
+
+    def _parse_config(self, device, modify_config=False):
+        """
+        Parses the running configuration of the device and buckets the lines needed by the configuration conditions
+        of the loaded rules in a single pass
+
+        The parse comes from the parse cache, cached parses are shared and are never modified. When the rules modify
+        the configuration, they modify a ConfigOverlay of the parse. With use_config_tree, the configuration is
+        parsed into a ConfigTree, which reads a MappedConfig in place.
+
+        Without modify_config, the configuration is only parsed when the first condition uses it.
+
+        :param device: str
+        :param modify_config: bool
+        :return: ScannedConfig, or ConfigOverlay of the ScannedConfig with modify_config
+        """
+        load = self._config_loader(device)
+        if modify_config:
+            return ConfigOverlay(self._scan_plan.scan(load()))
+        return self._scan_plan.scan(load=load)
+
+    def _record_parse(self, device, parse, start):
+        """
+        With profiling, parses a lazily loaded configuration before the rules are timed and records the time spent
+        since start preparing the parse as the <parse> entry of the device. Otherwise the parse would be timed in
+        the first condition using the configuration.
+
+        :param device: str
+        :param parse: ScannedConfig or ConfigOverlay
+        :param start: float, time.perf_counter() before the parse was prepared
+        """
+        if self._profiler is None:
+            return
+        if isinstance(parse, ScannedConfig):
+            parse.load()
+        self._profiler.record_parse(device, time.perf_counter() - start)
+
+    def _config_loader(self, device):
+        """
+        :param device: str
+        :return: function without arguments parsing the current configuration of the device through the parse cache
+        """
+        config = self.running_config[device]
+        config_tree = self._config_tree
+        parse_cache = self._parse_cache
+
+        def load():
+            self.logger.debug("Parsing configuration of {}".format(device))
+            if parse_cache is not None:
+                return parse_cache.get(config, parser=ConfigTree if config_tree else CiscoConfParse)
+            if config_tree:
+                return ConfigTree(config)
+            return CiscoConfParse(config.splitlines())
+        return load
+
+    def _release_parse(self, device):
+        """
+        Replaces the parse of the device with one that is only made if it is used again once the rules are
+        evaluated. The objects of the conditions hold LineRef objects, so the parse is released unless it is kept
+        for an incremental run.
+        """
+        if not self._incremental:
+            self._confparsed_config[device] = self._parse_config(device)
+
+    @staticmethod
+    def _modified(old_parse, new_parse, cache):
+        """
+        Carries the condition results forward when a rule run with modify_config returns a new overlay, the results
+        of the conditions that do not scan for a line of the changed blocks stay valid
+
+        :return: ConditionCache for new_parse
+        """
+        if new_parse is old_parse or not isinstance(new_parse, ConfigOverlay) or cache is None:
+            return cache
+        return cache.carry_forward(old_parse, new_parse, new_parse.delta(old_parse))
+
+    def _prepare_device(self, device, modify_config=False):
+        """
+        Parses the configuration of the device and creates the condition cache for evaluating the rules.
+
+        In incremental mode, the parse and the condition results of the previous run are reused when the
+        configuration has not changed. When it has changed, the results of conditions that do not scan for any line
+        of the changed blocks are carried forward, see ConditionCache.carry_forward.
+
+        :param device: str
+        :param modify_config: bool, the parse is modified by the rules, nothing is reused
+        :return: tuple, (parse, ConditionCache)
+        """
+        previous = self._previous.get(device)
+        if not self._incremental or modify_config or previous is None:
+            return self._parse_config(device, modify_config=modify_config), ConditionCache()
+        config, old_parse, old_cache = previous
+        if config == self.running_config[device] and getattr(old_parse, '_plan', None) is self._scan_plan:
+            self.logger.info("Device {}: configuration unchanged, reusing {} condition results".format(
+                device, len(old_cache)))
+            return old_parse, old_cache
+        parse = self._parse_config(device)
+        if not len(old_cache):
+            # nothing to carry forward, the configurations are not parsed to compare them
+            return parse, ConditionCache()
+        cache = old_cache.carry_forward(old_parse, parse, ConfigDelta(old_parse, parse))
+        self.logger.info("Device {}: configuration changed, reusing {} of {} condition results".format(
+            device, len(cache), len(old_cache)))
+        return parse, cache
+
+    def _remember(self, device, parse, cache):
+        """
+        Keeps the configuration, parse and condition results of the device for the next incremental run
+        """
+        if self._incremental:
+            self._previous[device] = (self.running_config[device], parse, cache)
+
+    def forget_previous(self, device=None):
+        """
+        Drops the state kept for incremental runs
+
+        :param device: optional, str, only drop the state of this device
+        """
+        if device is None:
+            self._previous = {}
+        else:
+            self._previous.pop(device, None)
 
     def run_all_rules(self, modify_config=False, skip_info=False,
                       skip_config=False, skip_facts=False, skip_commands=False, skip_methods=False, configs=None,
-                      commands=None, facts=None, methods=None):
+                      commands=None, facts=None, methods=None, lazy_collection=False, rule_major=False,
+                      incremental=False, config_files=None, processes=None, async_collection=False):
+        """
+        Collects the device information and analyzes all of the loaded rules for every device
+
+        :param configs: dict, device: configuration, str or MappedConfig
+
+        :param lazy_collection: bool, if True, the rules are first evaluated against the configuration and facts of
+        each device. CLI commands and getters are then only run for the rules that are still undecided on that
+        device, instead of the union of every rule's commands and getters.
+        :param rule_major: bool, if True, each rule is evaluated across all devices before moving to the next rule,
+        see run_rule_major
+        :param incremental: bool, if True, the parse and condition results of each device are kept. On the next
+        incremental run, a device whose configuration is unchanged reuses them, and a device whose configuration
+        changed only reruns the conditions scanning for lines in the changed top level blocks. Ignored with
+        modify_config.
+        :param config_files: dict, device: configuration file. The files are memory mapped instead of read, see
+        MappedConfig. Combine with use_config_tree, CiscoConfParse splits the configuration into lines anyway.
+        With collection_workers set, the information of the devices is collected concurrently, see
+        _get_device_info_concurrently. Devices whose collection fails are listed in collection_errors and are not
+        evaluated.
+
+        :param async_collection: bool, if True, the information is collected from every device from one event loop,
+        see get_device_info_async
+        :param processes: optional int, number of worker processes. The rules of the devices are evaluated in a
+        process pool instead of one device after the other, see _run_in_processes. rule_major and incremental are
+        ignored.
+        :return: self.matches
+        """
         if configs and not isinstance(configs, dict):
             raise AttributeError("configs must be a dictionary")
+        if config_files and not isinstance(config_files, dict):
+            raise AttributeError("config_files must be a dictionary")
         if commands and not isinstance(commands, dict):
             raise AttributeError("commands must be a dictionary")
         if facts and not isinstance(configs, dict):
@@ -106,9 +372,18 @@ class TestTask(abs_task):
         self._skip_facts = skip_facts
         self._skip_commands = skip_commands
         self._skip_methods = skip_methods
+        self._lazy_collection = lazy_collection
+        self._async_collection = async_collection
+        self._incremental = incremental and not modify_config
+        if not self._need_config and not modify_config and not self._skip_config:
+            self.logger.info("No loaded rule has a configuration condition, configurations are not retrieved")
+            self._skip_config = True
         if configs:
             self._skip_config = True
             self._running_config = configs
+        if config_files:
+            self._skip_config = True
+            self._running_config = {device: MappedConfig.from_file(path) for device, path in config_files.items()}
         if commands:
             self._skip_commands = True
             self._cli_commands = commands
@@ -121,11 +396,88 @@ class TestTask(abs_task):
         self.get_device_info()
 
         self.logger.debug("Running all rules for loaded rules {}".format(self.loaded_rules))
-        for device in self.device_list:
-            self.logger.debug("Running all rules for {}".format(device))
-            self.run_all_device_rules(device, modify_config=modify_config)
+        evaluated = False
+        if processes and processes > 1 and len(self._evaluated_devices()) > 1:
+            evaluated = self._run_in_processes(processes, modify_config=modify_config)
+        if not evaluated:
+            if rule_major:
+                self.run_rule_major(modify_config=modify_config)
+            else:
+                for device in self._evaluated_devices():
+                    self.logger.debug("Running all rules for {}".format(device))
+                    self.run_all_device_rules(device, modify_config=modify_config)
+        self.logger.info("Regex registry: {}".format(registry.report()))
+        if self._parse_cache is not None:
+            self.logger.info("Parse cache: {}".format(self._parse_cache.report()))
         return self.matches
 
+    def _worker_options(self):
+        """
+        :return: dict, the settings of the task the worker processes apply to their own task
+        """
+        parse_cache = None
+        if self._parse_cache is not None:
+            parse_cache = (self._parse_cache.max_lines, self._parse_cache.directory)
+        return {'config_tree': self._config_tree, 'parse_cache': parse_cache, 'profile': self._profiler is not None}
+
+    def _run_in_processes(self, processes, modify_config=False):
+        """
+        Evaluates the rules of every device in a pool of worker processes.
+
+        Each worker receives the loaded rules once, then the configuration, cli command outputs, facts and get
+        method outputs of one device at a time, see tasks.parallel. The workers parse the configurations through
+        their own parse caches, sharing the disk layer of the parse cache of the task, and return the matches and
+        the objects of the conditions converted to LineRef objects, see rules.objects.compact. The parses stay in
+        the workers, self._confparsed_config holds a parse of each configuration made when it is first used.
+
+        :param processes: int, number of worker processes
+        :param modify_config: bool
+        :return: bool, False if the loaded rules cannot be sent to the workers and nothing was evaluated
+        """
+        try:
+            pickle.dumps(self.loaded_rules)
+        except (pickle.PicklingError, AttributeError, TypeError) as err:
+            self.logger.warning("Loaded rules cannot be sent to worker processes, evaluating in this process: "
+                                "{}".format(err))
+            return False
+        if self._incremental:
+            self.logger.info("incremental is ignored when evaluating in worker processes")
+            self._incremental = False
+        jobs = []
+        for device in self._evaluated_devices():
+            # parses made to plan the collection are not sent to the workers
+            self._planned.pop(device, None)
+            jobs.append((device, self._running_config[device], self._cli_commands[device],
+                         self._device_facts[device], self._get_methods[device], self._lazy_collection,
+                         modify_config))
+        self.logger.info("Evaluating {} devices in {} worker processes".format(len(jobs), processes))
+        with ProcessPoolExecutor(max_workers=processes, initializer=parallel.init_worker,
+                                 initargs=(type(self), self.loaded_rules, self._worker_options())) as executor:
+            for answer in executor.map(parallel.evaluate_device, jobs):
+                device = answer['device']
+                self._matches[device] = answer['matches']
+                self._objects[device] = answer['objects']
+                if answer['config'] is not None:
+                    load = self._loader(answer['config'], self._config_tree)
+                    self._confparsed_config[device] = self._scan_plan.scan(load=load)
+                else:
+                    self._confparsed_config[device] = self._parse_config(device)
+                    load = self._config_loader(device)
+                self._line_sources[device] = LineSource(load)
+                bind(answer['objects'], self._line_sources[device])
+                if answer['profile'] is not None and self._profiler is not None:
+                    self._profiler.merge(answer['profile'])
+                self.logger.debug("_run_in_processes: device {}: {}".format(device, self._matches[device]))
+        return True
+
+    @staticmethod
+    def _loader(lines, config_tree):
+        def load():
+            if config_tree:
+                return ConfigTree(lines)
+            return CiscoConfParse(lines)
+        return load
+
     def run_all_device_rules(self, device, modify_config=False):
         """
 
@@ -139,50 +491,257 @@ class TestTask(abs_task):
         self.logger.debug("confirm_all_matches: self.matches: {}".format(self.matches))
 
     def get_device_info(self):
+        self._collection_errors = {}
+        if self._async_collection and not self._skip_info:
+            asyncio.run(self.get_device_info_async())
+        elif (self._collection_workers and self._collection_workers > 1 and not self._skip_info and
+                len(self.device_list) > 1):
+            self._get_device_info_concurrently()
+        else:
+            for device_name in self.device_list:
+                self._get_device_info(device_name)
+
+    def _get_device_info_concurrently(self):
+        """
+        Collects the information of the devices in a pool of collection_workers threads, so the collection takes
+        about as long as the slowest devices instead of the sum of every device.
+
+        At most site_limit devices of the same site are collected from at the same time. The devices are submitted
+        alternating between the sites, so the workers are not all waiting on the limit of one site.
+
+        The information of each device is recorded as soon as its collection finishes. A device whose collection
+        fails does not stop the others: the exception is recorded in self.collection_errors, the partial
+        information of the device is dropped and its rules are not evaluated.
+        """
+        by_site = OrderedDict()
+        semaphores = {}
+        for device_name in self.device_list:
+            site = self._device_site(device_name)
+            by_site.setdefault(site, []).append(device_name)
+            if self._site_limit and site is not None and site not in semaphores:
+                semaphores[site] = threading.BoundedSemaphore(self._site_limit)
+        order = [device_name for batch in zip_longest(*by_site.values()) for device_name in batch
+                 if device_name is not None]
+
+        def collect(device_name):
+            semaphore = semaphores.get(self._device_site(device_name))
+            if semaphore is None:
+                self._get_device_info(device_name)
+            else:
+                with semaphore:
+                    self._get_device_info(device_name)
+
+        self.logger.info("Collecting from {} devices with {} workers, {} per site".format(
+            len(order), self._collection_workers, self._site_limit or "no limit"))
+        with ThreadPoolExecutor(max_workers=self._collection_workers) as executor:
+            futures = {executor.submit(collect, device_name): device_name for device_name in order}
+            for done, future in enumerate(as_completed(futures), 1):
+                device_name = futures[future]
+                try:
+                    future.result()
+                except Exception as err:
+                    self.logger.error("Collection from {} failed: {}".format(device_name, err))
+                    self._collection_errors[device_name] = err
+                    self._discard_device_info(device_name)
+                else:
+                    self.logger.info("Collected {} ({} of {})".format(device_name, done, len(futures)))
+        if self._collection_errors:
+            self.logger.warning("Collection failed for {} of {} devices: {}".format(
+                len(self._collection_errors), len(order), list(self._collection_errors)))
+
+    async def get_device_info_async(self):
+        """
+        Collects the information of every device from one event loop with AsyncDevice, for sweeps over thousands of
+        devices at the same time.
+
+        At most collection_workers devices, and site_limit devices of the same site, are collected from at the same
+        time, no limit if None. Blocking drivers are called in a pool of collection_workers threads, or in the
+        default executor of the event loop. Failures are isolated and recorded in self.collection_errors, as with
+        _get_device_info_concurrently.
+        """
+        self._collection_errors = {}
+        limit = asyncio.Semaphore(self._collection_workers) if self._collection_workers else None
+        semaphores = {}
         for device_name in self.device_list:
-            self.logger.info("Getting info for device {}".format(device_name))
-            self.logger.debug("Entering context manager for {}".format(self.device_class))
-            if not self._skip_info:
-                with Device(device_name, self.device_class, self.username, self.password, timeout=self.timeout,
-                            optional_args=self.optional_args) as device:
-                    if not self._skip_config:
-                        self.logger.debug("Getting config for device {}".format(device_name))
-                        device.get_config()
-                        self._running_config[device_name] = device.running_config
-                        self.logger.debug("Received config")
-                    elif device_name not in self._running_config:
-                        self._running_config[device_name] = ""
-                    if not self._skip_facts:
-                        self._device_facts[device_name] = device.get_facts()
-                    elif device_name not in self._device_facts:
-                        self._device_facts[device_name] = {}
-                    self.logger.debug("command list for {}: {}".format(device_name, self._cli_command_list))
-                    if not self._skip_commands and self._cli_command_list:
-                        self.logger.debug("Sending commands {} to {}".format(self._cli_command_list, device_name))
-                        device.run_cli_command_list(self._cli_command_list)
-                        self._cli_commands[device_name] = device.cli_command_output
-                        logger.debug(
-                            "_cli_commands for device {} : {}".format(device_name, self._cli_commands[device_name]))
-                    elif device_name not in self._cli_commands:
-                        self._cli_commands[device_name] = {}
-                    if not self._skip_methods and self._get_method_list:
-                        self._get_methods[device_name] = {}
-                        for method in self._get_method_list:
-                            self.logger.debug("Running napalm method {} to {}".format(method, device_name))
-                            result = eval(f"device.{method}()")
-                            self._get_methods[device_name][method] = result
-                            logger.debug("results for method {} on device {} : {}".format(method, device_name,
-                                                                                          self._get_methods[device_name][
-                                                                                              method]))
-                        logger.debug("final methods dictionary: {}".format(self._get_methods[device_name]))
-                    elif device_name not in self._get_methods:
-                        self._get_methods[device_name] = {}
+            site = self._device_site(device_name)
+            if self._site_limit and site is not None and site not in semaphores:
+                semaphores[site] = asyncio.Semaphore(self._site_limit)
+        executor = ThreadPoolExecutor(max_workers=self._collection_workers) if self._collection_workers else None
+
+        async def collect(device_name):
+            site_limit = semaphores.get(self._device_site(device_name))
+            try:
+                if limit is not None:
+                    await limit.acquire()
+                if site_limit is not None:
+                    await site_limit.acquire()
+                try:
+                    await self._get_device_info_async(device_name, executor)
+                finally:
+                    if site_limit is not None:
+                        site_limit.release()
+                    if limit is not None:
+                        limit.release()
+            except Exception as err:
+                self.logger.error("Collection from {} failed: {}".format(device_name, err))
+                self._collection_errors[device_name] = err
+                self._discard_device_info(device_name)
             else:
-                if device_name not in self._running_config:
+                self.logger.info("Collected {}".format(device_name))
+
+        self.logger.info("Collecting from {} devices in an event loop, {} at a time, {} per site".format(
+            len(self.device_list), self._collection_workers or "no limit", self._site_limit or "no limit"))
+        try:
+            await asyncio.gather(*[collect(device_name) for device_name in self.device_list])
+        finally:
+            if executor is not None:
+                executor.shutdown(wait=False)
+        if self._collection_errors:
+            self.logger.warning("Collection failed for {} of {} devices: {}".format(
+                len(self._collection_errors), len(self.device_list), list(self._collection_errors)))
+
+    async def _get_device_info_async(self, device_name, executor=None):
+        """
+        Same as _get_device_info with an AsyncDevice
+        """
+        self.logger.info("Getting info for device {}".format(device_name))
+        async with AsyncDevice(device_name, self.device_class, self.username, self.password, timeout=self.timeout,
+                               optional_args=self.optional_args, executor=executor,
+                               pool=self._session_pool) as device:
+            if not self._skip_config:
+                self.logger.debug("Getting config for device {}".format(device_name))
+                await device.get_config()
+                config = device.running_config
+                if self._config_spool is not None:
+                    config = MappedConfig.spool(config, self._config_spool, device_name)
+                self._running_config[device_name] = config
+                self.logger.debug("Received config")
+            elif device_name not in self._running_config:
+                self._running_config[device_name] = ""
+            if not self._skip_facts:
+                self._device_facts[device_name] = await device.get_facts()
+            elif device_name not in self._device_facts:
+                self._device_facts[device_name] = {}
+            cli_command_list = self._cli_command_list
+            get_method_list = self._get_method_list
+            if self._lazy_collection:
+                # parsing and evaluating the rules would stall every session of the event loop
+                cli_command_list, get_method_list = await asyncio.get_running_loop().run_in_executor(
+                    executor, self._plan_device_collection_locked, device_name)
+            if not self._skip_commands and cli_command_list:
+                self.logger.debug("Sending commands {} to {}".format(cli_command_list, device_name))
+                await device.run_cli_command_list(cli_command_list, pipelined=self._pipelined_cli)
+                self._cli_commands[device_name] = device.cli_command_output
+            elif device_name not in self._cli_commands:
+                self._cli_commands[device_name] = {}
+            if not self._skip_methods and get_method_list:
+                methods = {}
+                for method in get_method_list:
+                    self.logger.debug("Running napalm method {} to {}".format(method, device_name))
+                    methods[method] = await getattr(device, method)()
+                self._get_methods[device_name] = methods
+                logger.debug("final methods dictionary: {}".format(self._get_methods[device_name]))
+            elif device_name not in self._get_methods:
+                self._get_methods[device_name] = {}
+
+    def _plan_device_collection_locked(self, device_name):
+        with self._plan_lock:
+            return self._plan_device_collection(device_name)
+
+    def _discard_device_info(self, device_name):
+        for state in (self._running_config, self._device_facts, self._cli_commands, self._get_methods,
+                      self._planned):
+            state.pop(device_name, None)
+
+    def _evaluated_devices(self):
+        """
+        :return: list, the devices of device_list whose information was collected
+        """
+        return [device for device in self.device_list if device not in self._collection_errors]
+
+    def _get_device_info(self, device_name):
+        self.logger.info("Getting info for device {}".format(device_name))
+        self.logger.debug("Entering context manager for {}".format(self.device_class))
+        if not self._skip_info:
+            with Device(device_name, self.device_class, self.username, self.password, timeout=self.timeout,
+                        optional_args=self.optional_args, pool=self._session_pool) as device:
+                if not self._skip_config:
+                    self.logger.debug("Getting config for device {}".format(device_name))
+                    device.get_config()
+                    config = device.running_config
+                    if self._config_spool is not None:
+                        config = MappedConfig.spool(config, self._config_spool, device_name)
+                    self._running_config[device_name] = config
+                    self.logger.debug("Received config")
+                elif device_name not in self._running_config:
                     self._running_config[device_name] = ""
-                if device_name not in self._device_facts:
+                if not self._skip_facts:
+                    self._device_facts[device_name] = device.get_facts()
+                elif device_name not in self._device_facts:
                     self._device_facts[device_name] = {}
-                if device_name not in self._cli_commands:
+                cli_command_list = self._cli_command_list
+                get_method_list = self._get_method_list
+                if self._lazy_collection:
+                    cli_command_list, get_method_list = self._plan_device_collection_locked(device_name)
+                self.logger.debug("command list for {}: {}".format(device_name, cli_command_list))
+                if not self._skip_commands and cli_command_list:
+                    self.logger.debug("Sending commands {} to {}".format(cli_command_list, device_name))
+                    device.run_cli_command_list(cli_command_list, pipelined=self._pipelined_cli)
+                    self._cli_commands[device_name] = device.cli_command_output
+                    logger.debug(
+                        "_cli_commands for device {} : {}".format(device_name, self._cli_commands[device_name]))
+                elif device_name not in self._cli_commands:
                     self._cli_commands[device_name] = {}
-                if device_name not in self._get_methods:
-                    self._get_methods[device_name] = {}
\ No newline at end of file
+                if not self._skip_methods and get_method_list:
+                    self._get_methods[device_name] = {}
+                    for method in get_method_list:
+                        self.logger.debug("Running napalm method {} to {}".format(method, device_name))
+                        result = eval(f"device.{method}()")
+                        self._get_methods[device_name][method] = result
+                        logger.debug("results for method {} on device {} : {}".format(method, device_name,
+                                                                                      self._get_methods[device_name][
+                                                                                          method]))
+                    logger.debug("final methods dictionary: {}".format(self._get_methods[device_name]))
+                elif device_name not in self._get_methods:
+                    self._get_methods[device_name] = {}
+        else:
+            if device_name not in self._running_config:
+                self._running_config[device_name] = ""
+            if device_name not in self._device_facts:
+                self._device_facts[device_name] = {}
+            if device_name not in self._cli_commands:
+                self._cli_commands[device_name] = {}
+            if device_name not in self._get_methods:
+                self._get_methods[device_name] = {}
+
+    def _plan_device_collection(self, device_name):
+        """
+        Evaluates the rules that need cli output or getters using only the configuration and facts of the device.
+        Conditions are evaluated cheapest first, so a rule such as
+        Match("feature_vpc", "global", (True, r"^feature\s+vpc")) & CmdParse("vpc", {'show vpc': ...})
+        is decided without running "show vpc" on devices without vpc.
+
+        The parse and the condition results are kept and reused by run_rule.
+
+        :param device_name: str
+        :return: tuple, (set of cli commands, set of get methods) needed by the rules still undecided
+        """
+        parse, cache = self._prepare_device(device_name)
+        cli_command_list = set([])
+        get_method_list = set([])
+        for rule, rule_obj in self.loaded_rules.items():
+            if not rule_obj.need_cli and not rule_obj.need_get:
+                continue
+            result, _, _ = rule_obj.confirm_match(parse, cli_commands={}, hard_dict=self.device_facts[device_name],
+                                                  get_methods_output={}, cache=cache, partial=True)
+            self.logger.debug("_plan_device_collection: device {}, rule {}: {}".format(device_name, rule, result))
+            if result is None:
+                if rule_obj.need_cli:
+                    cli_command_list = cli_command_list | rule_obj.cli_commands
+                if rule_obj.need_get:
+                    get_method_list = get_method_list | rule_obj.get_list
+        self._planned[device_name] = (parse, cache)
+        self.logger.info("Device {}: collecting {} of {} commands and {} of {} getters".format(
+            device_name, len(cli_command_list), len(self._cli_command_list), len(get_method_list),
+            len(self._get_method_list)))
+        return cli_command_list, get_method_list
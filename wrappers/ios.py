@@ -1,15 +1,21 @@
 import logging
+import re
 import socket
 import sys
 import traceback
+import uuid
 
 import paramiko
 from napalm.base.exceptions import ConnectionException
 from napalm.ios import IOSDriver
-from netmiko import NetMikoTimeoutException, NetMikoAuthenticationException
+from netmiko import NetMikoTimeoutException, NetMikoAuthenticationException, ReadTimeout
 
 logger = logging.getLogger(__name__)
 
+# commands written to the channel before the device has answered, beyond this the batch is split
+PIPELINE_BATCH = 20
+
+
 class IosNapalmWrapper(IOSDriver):
     def open(self):
         """Open a connection to the device."""
@@ -154,6 +160,97 @@ class IosNapalmWrapper(IOSDriver):
 
         return output
 
+    def cli_pipelined(self, commands, batch_size=PIPELINE_BATCH):
+        """
+        Same as cli, with the commands written to the channel in batches instead of waiting for the prompt after
+        each command.
+
+        A comment line carrying a unique marker follows each command. The device executes the lines in order and
+        echoes each marker after the output of its command, so the output of the batch is read once, up to the
+        prompt following the last marker, and split at the markers. The output of each command is cleaned up as
+        cli cleans it up. A batch whose output cannot be split that way has been read up to the prompt following
+        its last marker and is run again with cli. A batch whose last marker is not read within timeout seconds
+        per command may still be running, or queued, on the device, so its output could be read as the output of
+        other commands: the connection is closed and reopened and the batch is run with cli on the new connection.
+
+        Example:
+        wrapper.cli_pipelined(['show clock', 'show vpc brief'])
+        {'show clock': '*22:01:51.165 UTC Thu Feb 18 2016', 'show vpc brief': '...'}
 
+        :param commands: list of commands
+        :param batch_size: int, number of commands written at once
+        :return: dict, command: output
+        """
+        if type(commands) is not list:
+            raise TypeError("Please enter a valid list of commands!")
+        cli_output = {}
+        for start in range(0, len(commands), batch_size):
+            batch = commands[start:start + batch_size]
+            try:
+                outputs = self._run_pipelined(batch)
+            except ReadTimeout as err:
+                logger.warning("cli_pipelined: timed out reading output from {}, reopening the connection: "
+                               "{}".format(self.hostname, err))
+                # the rest of the batch would still write to this channel while cli reads it
+                self._reopen()
+                outputs = self.cli(batch)
+            except Exception:
+                exc_type, exc_value, exc_traceback = sys.exc_info()
+                stacktrace = traceback.extract_tb(exc_traceback)
+                logger.critical("cli_pipelined: Command Failure for " + self.hostname)
+                logger.debug("cli_pipelined: Commands: {}".format(batch))
+                logger.debug(sys.exc_info())
+                logger.debug(stacktrace)
+                raise
+            if outputs is None:
+                logger.warning("cli_pipelined: output from {} could not be split, running the commands one at a "
+                               "time".format(self.hostname))
+                # the output was read up to the prompt following the last marker, nothing of the batch is pending
+                outputs = self.cli(batch)
+            cli_output.update(outputs)
+        return cli_output
 
+    def _reopen(self):
+        """
+        Replaces the connection with a new one, discarding whatever the device still sends on the old one
+        """
+        try:
+            self.close()
+        except Exception as err:
+            logger.debug("_reopen: error closing connection to {}: {}".format(self.hostname, err))
+        self.open()
 
+    def _run_pipelined(self, batch):
+        """
+        :param batch: list of commands
+        :return: dict, command: output, or None if the output does not have the markers in order
+        :raises ReadTimeout: if the last marker is not read within timeout seconds per command of the batch
+        """
+        connection = self.device
+        # the whole batch is read at once, cli waits for each command separately
+        read_timeout = self.timeout * len(batch)
+        marker = "pipeline-{}".format(uuid.uuid4().hex)
+        lines = []
+        for i, command in enumerate(batch):
+            lines.append(command)
+            lines.append("! {}-{}".format(marker, i))
+        logger.debug("_run_pipelined: writing {} commands to {}".format(len(batch), self.hostname))
+        connection.write_channel(connection.RETURN.join(lines) + connection.RETURN)
+        output = connection.read_until_pattern(pattern=re.escape("{}-{}".format(marker, len(batch) - 1)),
+                                               read_timeout=read_timeout)
+        output += connection.read_until_prompt(read_timeout=read_timeout)
+        output = connection.normalize_linefeeds(output)
+        # each marker is echoed on its own line, after the prompt
+        found = list(re.finditer(r"^.*{}-(\d+)[ \t]*$".format(re.escape(marker)), output, re.M))
+        if [int(match.group(1)) for match in found] != list(range(len(batch))):
+            return None
+        outputs = {}
+        previous = 0
+        for command, match in zip(batch, found):
+            segment = output[previous:match.start()].strip('\n').split('\n')
+            previous = match.end()
+            # the first line is the prompt followed by the echo of the command
+            if not segment or not segment[0].rstrip().endswith(command.strip()):
+                return None
+            outputs[command] = self._send_command_postprocess('\n'.join(segment[1:]))
+        return outputs